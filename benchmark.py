@@ -0,0 +1,251 @@
+"""Benchmark the scanning effects and the full pipeline on synthetic PDFs
+
+Usage: python benchmark.py [--dpi 72 150 300 600] [--pages 1 10 100]
+                           [--output bench.json] [--baseline old.json]
+
+Test documents are generated locally with fitz: text-heavy, image-heavy
+and mixed page sizes, with any page count. Every effect is timed on a
+rendered page at each DPI, and process_pdf on every document at each DPI,
+each run in a fresh process so its peak RSS is its own. Results are saved
+as JSON; with --baseline the run is compared against an earlier one and
+the exit status is 1 if anything got slower than --tolerance allows.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+from PIL import Image
+import fitz  # PyMuPDF
+from main import PDFScannerEffects, StageProfiler
+
+KINDS = ("text", "image", "mixed")
+PAGE_SIZES = [fitz.paper_rect(name) for name in ("a4", "letter", "a3", "a5-l", "legal")]
+WORDS = ("scanner document page quality contract invoice report figure table section "
+         "paragraph revision signature appendix summary").split()
+
+# process_pdf options for full runs: every effect on, as a busy real job would have them
+FULL_OPTIONS = {
+    'rotate': True, 'max_rotation': 1.5, 'grayscale': True, 'bw': False, 'add_noise': True,
+    'fold_marks': True, 'fold_count': 1, 'add_shadow': True, 'blur': 0.5, 'quality': 85,
+}
+
+def make_image(rng, width, height):
+    """PNG bytes of a photo-like image: smooth gradients plus grain"""
+    y, x = np.mgrid[0:height, 0:width]
+    channels = [np.sin(x / rng.uniform(20, 80) + rng.uniform(0, 6)) * np.cos(y / rng.uniform(20, 80)) for _ in range(3)]
+    data = (np.stack(channels, axis=-1) * 100 + 128 + rng.normal(0, 12, (height, width, 3))).clip(0, 255)
+    buffer = io.BytesIO()
+    Image.fromarray(data.astype(np.uint8), "RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def make_pdf(path, kind, pages, seed=0):
+    """Write a synthetic test PDF of the given kind and page count"""
+    rng = np.random.default_rng([seed, pages, KINDS.index(kind)])
+    images = [make_image(rng, 640, 480) for _ in range(4)] if kind != "text" else []
+    doc = fitz.open()
+    for page_num in range(pages):
+        rect = PAGE_SIZES[page_num % len(PAGE_SIZES)] if kind == "mixed" else PAGE_SIZES[0]
+        page = doc.new_page(width=rect.width, height=rect.height)
+        body = fitz.Rect(50, 50, rect.width - 50, rect.height - 50)
+        if kind == "image":
+            page.insert_image(body, stream=images[page_num % len(images)], keep_proportion=False)
+            continue
+        if kind == "mixed":
+            figure = fitz.Rect(body.x0, body.y0, body.x1, body.y0 + body.height / 3)
+            page.insert_image(figure, stream=images[page_num % len(images)])
+            body.y0 = figure.y1 + 20
+        words = rng.choice(WORDS, 1200)
+        page.insert_text((50, 35), f"Page {page_num + 1}", fontsize=14)
+        # insert_textbox writes nothing when the text overflows, so drop words until it fits
+        count = len(words)
+        while page.insert_textbox(body, " ".join(words[:count]), fontsize=9) < 0:
+            count = count * 9 // 10
+        assert words[0] in page.get_text(), f"no body text on page {page_num + 1}"
+    doc.save(path, deflate=True)
+    doc.close()
+
+def document_path(work_dir, kind, pages):
+    """Path of a generated test PDF, created on first use"""
+    path = os.path.join(work_dir, f"{kind}-{pages}.pdf")
+    if not os.path.exists(path):
+        make_pdf(path, kind, pages)
+    return path
+
+def best_time(function, repeat):
+    """Fastest of repeat calls of function, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def bench_effects(path, dpi, repeat):
+    """Time rendering and every effect function on the first page at one DPI"""
+    rng = np.random.default_rng(0)
+    with fitz.open(path) as doc:
+        page = doc[0]
+        img = PDFScannerEffects.convert_page_to_image(page, dpi=dpi)
+        gray = PDFScannerEffects.convert_to_grayscale(img)
+        cases = {
+            "render": lambda: PDFScannerEffects.convert_page_to_image(page, dpi=dpi),
+            "render_gray": lambda: PDFScannerEffects.convert_page_to_image(page, dpi=dpi, mode="L"),
+            "rotation": lambda: PDFScannerEffects.add_rotation(gray, rng=rng),
+            "grayscale": lambda: PDFScannerEffects.convert_to_grayscale(img),
+            "black_and_white": lambda: PDFScannerEffects.convert_to_black_and_white(gray),
+            "noise": lambda: PDFScannerEffects.add_noise(gray, rng=rng),
+            "fold_marks": lambda: PDFScannerEffects.add_fold_marks(gray, count=2, rng=rng),
+            "edge_shadow": lambda: PDFScannerEffects.add_edge_shadow(gray),
+            "blur": lambda: PDFScannerEffects.apply_blur(gray, radius=0.5),
+        }
+        megapixels = img.width * img.height / 1e6
+        results = {}
+        for name, case in cases.items():
+            seconds = best_time(case, repeat)
+            results[f"effect:{name}@{dpi}"] = {
+                "effect": name, "dpi": dpi, "seconds": seconds, "megapixels_per_sec": megapixels / seconds,
+            }
+        return results
+
+def peak_rss():
+    """Peak RSS of this process in bytes
+    
+    VmHWM is used where there is one, since ru_maxrss also counts what the
+    process used before it exec'd into a fresh interpreter.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return StageProfiler.max_rss()
+
+def _full_run(path, options, queue):
+    profiler = options.get('hooks')
+    with tempfile.TemporaryDirectory() as out_dir:
+        output = os.path.join(out_dir, "out.pdf")
+        start = time.perf_counter()
+        PDFScannerEffects.process_pdf(path, output, options)
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(output)
+    queue.put({
+        "seconds": seconds,
+        "output_bytes": size,
+        "peak_rss_bytes": peak_rss(),
+        "worker_peak_rss_bytes": StageProfiler.max_rss(children=True) or None,
+        "stages": {name: total["seconds"] for name, total in profiler.report()["stages"].items()} if profiler else None,
+    })
+
+def bench_full(path, pages, dpi, jobs, stages=False):
+    """Run process_pdf in a fresh process and measure it"""
+    options = dict(FULL_OPTIONS, dpi=dpi, workers=jobs, seed=0)
+    if stages:
+        options['hooks'] = StageProfiler()
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_full_run, args=(path, options, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    result.update(pages=pages, dpi=dpi, jobs=jobs, pages_per_sec=pages / result["seconds"])
+    return result
+
+def run(args):
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), "scanner-benchmark")
+    os.makedirs(work_dir, exist_ok=True)
+    results = {}
+
+    for dpi in args.dpi:
+        print(f"effects at {dpi} DPI", file=sys.stderr)
+        results.update(bench_effects(document_path(work_dir, "mixed", 1), dpi, args.repeat))
+
+    for kind in args.kinds:
+        for pages in args.pages:
+            path = document_path(work_dir, kind, pages)
+            for dpi in args.dpi:
+                print(f"process_pdf {kind}, {pages} pages at {dpi} DPI", file=sys.stderr)
+                result = bench_full(path, pages, dpi, args.jobs, args.stages)
+                results[f"process_pdf:{kind}-{pages}@{dpi}"] = dict(result, document=kind)
+
+    return {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pymupdf": fitz.VersionBind,
+            "numpy": np.__version__,
+            "pillow": Image.__version__,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+def compare(report, baseline, tolerance):
+    """Print the change of every result against a baseline report; return the regressions"""
+    regressions = []
+    print(f"{'case':40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in report["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:40} {'-':>10} {result['seconds']:10.4f}      new")
+            continue
+        change = result["seconds"] / old["seconds"] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  slower"
+        print(f"{name:40} {old['seconds']:10.4f} {result['seconds']:10.4f} {change:+8.1%}{flag}")
+        if "peak_rss_bytes" in result and old.get("peak_rss_bytes"):
+            rss_change = result["peak_rss_bytes"] / old["peak_rss_bytes"] - 1
+            if abs(rss_change) > tolerance:
+                print(f"{'':40} peak RSS {old['peak_rss_bytes'] / 2**20:.0f} -> {result['peak_rss_bytes'] / 2**20:.0f} MB")
+    return regressions
+
+def print_report(report):
+    for name, result in report["results"].items():
+        if "pages_per_sec" in result:
+            print(f"{name:40} {result['seconds']:8.3f} s  {result['pages_per_sec']:8.2f} pages/s  "
+                  f"peak RSS {result['peak_rss_bytes'] / 2**20:6.0f} MB")
+        else:
+            print(f"{name:40} {result['seconds'] * 1000:8.2f} ms  {result['megapixels_per_sec']:8.1f} MP/s")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark scanning effects on synthetic PDFs")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[72, 150, 300, 600], help="DPIs to benchmark")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10], help="Page counts of the test documents (1 to 1000)")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS), help="Kinds of test documents")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per effect timing, the fastest is kept")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes for process_pdf")
+    parser.add_argument("--stages", action="store_true", help="Also record per-stage time of full runs")
+    parser.add_argument("--work-dir", help="Where generated test PDFs are kept (default: temp directory)")
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Slowdown against the baseline counted as a regression")
+    args = parser.parse_args()
+    if any(not 1 <= pages <= 1000 for pages in args.pages):
+        parser.error("--pages must be between 1 and 1000")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} slower than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
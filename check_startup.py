@@ -0,0 +1,53 @@
+"""Check that the headless core starts within its time budget
+
+Usage: python check_startup.py [margin_ms]
+
+Imports main in fresh interpreters, and PyMuPDF, NumPy and Pillow alone
+for comparison, taking the fastest of a few runs of each. Fails if main
+takes more than margin_ms longer than its dependencies, which it cannot
+avoid, or if importing it pulled in GUI modules.
+"""
+import os
+import subprocess
+import sys
+
+# Import time main may add to its dependencies; PyMuPDF and NumPy alone take most of the total
+MARGIN_MS = 100
+GUI_MODULES = ("tkinter", "PIL.ImageTk")
+RUNS = 5
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {modules}
+print((time.perf_counter() - start) * 1000)
+print(",".join(name for name in {gui!r} if name in sys.modules))
+"""
+
+def import_time(modules):
+    """Import time of modules in a fresh interpreter in ms, and the GUI modules it loaded"""
+    probe = PROBE.format(modules=modules, gui=GUI_MODULES)
+    # Run next to main.py, so the check works from any directory
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    elapsed, loaded = output.split("\n")[:2]
+    return float(elapsed), filter(None, loaded.split(","))
+
+def measure(runs=RUNS):
+    """Return the fastest import times of main and of its dependencies in ms, and the GUI modules main loaded"""
+    timings, baselines, loaded = [], [], set()
+    for _ in range(runs):
+        # Alternate the two, so a busy moment slows both alike
+        baselines.append(import_time("fitz, numpy, PIL.Image")[0])
+        elapsed, modules = import_time("main")
+        timings.append(elapsed)
+        loaded.update(modules)
+    return min(timings), min(baselines), sorted(loaded)
+
+if __name__ == "__main__":
+    margin = float(sys.argv[1]) if len(sys.argv) > 1 else MARGIN_MS
+    elapsed, baseline, loaded = measure()
+    print(f"import main: {elapsed:.0f} ms, dependencies alone: {baseline:.0f} ms (margin {margin:.0f} ms)")
+    if loaded:
+        print(f"GUI modules imported by the headless core: {', '.join(loaded)}")
+    sys.exit(1 if elapsed > baseline + margin or loaded else 0)
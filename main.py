@@ -1,16 +1,89 @@
 import argparse
 import os
-import random
-import tempfile
 import io
-from datetime import datetime
+import re
+import json
+import hashlib
+from datetime import datetime, timezone
 import uuid
-from PIL import Image, ImageDraw, ImageFilter, ImageTk
-import fitz  # PyMuPDF
-from PyPDF2 import PdfReader, PdfWriter
-import tkinter as tk
-from tkinter import filedialog, ttk, messagebox
+import glob
 import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from concurrent.futures import Future
+import numpy as np
+from PIL import Image, ImageFilter
+import fitz  # PyMuPDF
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# A finished page: its size in pixels, the encoded images that cover it and,
+# when the pipeline has hooks, the stage records taken while processing it
+EncodedPage = namedtuple("EncodedPage", ["width", "height", "tiles", "profile"], defaults=(None,))
+
+# One encoded image of a page, its position in page pixels and the PIL mode it was encoded from
+EncodedTile = namedtuple("EncodedTile", ["left", "top", "width", "height", "data", "mode"])
+
+# Where an image sits on its page, plus the random draws shared by all tiles of the page
+PageRegion = namedtuple("PageRegion", ["width", "height", "offset", "folds"])
+
+# Size of a page in pixels plus the random draws shared by all of its tiles
+PagePlan = namedtuple("PagePlan", ["width", "height", "angle", "folds"])
+
+# A document to process: its path (or a name when it is given as bytes),
+# the bytes themselves or None, its page count and per-page cache keys or None
+PageSource = namedtuple("PageSource", ["name", "data", "page_count", "cache_keys", "digest"])
+
+class ProcessingCancelled(Exception):
+    """Raised when a CancelToken stops a job; pages_done pages were written"""
+    
+    def __init__(self, pages_done=0):
+        super().__init__(f"Cancelled after {pages_done} pages")
+        self.pages_done = pages_done
+
+class CancelToken:
+    """Thread-safe request to stop a running job
+    
+    Checked between pages, and between the stages of pages processed in
+    this process. Pages already running in pool workers are dropped.
+    """
+    
+    def __init__(self):
+        self._event = threading.Event()
+    
+    def cancel(self):
+        self._event.set()
+    
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+    
+    def check(self):
+        """Raise ProcessingCancelled if cancellation was requested"""
+        if self._event.is_set():
+            raise ProcessingCancelled()
+
+class ProgressReporter:
+    """Calls progress(done, total, eta) as pages finish, eta in seconds or None"""
+    
+    def __init__(self, total, progress=None):
+        self.total = total
+        self.progress = progress
+        self.done = 0
+        self.started = time.monotonic()
+        if progress is not None:
+            progress(0, total, None)
+    
+    def advance(self, pages=1):
+        self.done += pages
+        if self.progress is not None:
+            elapsed = time.monotonic() - self.started
+            self.progress(self.done, self.total, elapsed / self.done * (self.total - self.done))
 
 class PDFScannerEffects:
     # List of realistic printer/scanner names
@@ -36,16 +109,52 @@ class PDFScannerEffects:
     ]
     
     @staticmethod
-    def convert_page_to_image(page, dpi=150):
-        """Convert a PDF page to a PIL Image"""
-        pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    def page_pixel_size(page, dpi=150):
+        """Size in pixels of a page rasterized at the given DPI"""
+        size = (page.rect * fitz.Matrix(dpi/72, dpi/72)).irect
+        return size.width, size.height
+    
+    @staticmethod
+    def convert_page_to_image(page, dpi=150, mode="RGB", angle=0, box=None):
+        """Convert a PDF page to a PIL Image in the given mode
+        
+        page may also be a fitz.DisplayList of the page. A non-zero angle
+        (degrees, counterclockwise) is applied by MuPDF while rasterizing.
+        The image keeps the size of the unrotated page, with white where
+        the rotated page does not reach. box = (left, top, right, bottom)
+        in page pixels renders only that region, through get_pixmap(clip=...).
+        """
+        scale = fitz.Matrix(dpi/72, dpi/72)
+        if not angle and box is None:
+            pix = page.get_pixmap(matrix=scale)
+            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        else:
+            matrix = fitz.Matrix(scale).prerotate(-angle)
+            width, height = PDFScannerEffects.page_pixel_size(page, dpi)
+            if box is None:
+                box = (0, 0, width, height)
+            
+            # The rotated page is centered on where the unrotated one would be
+            bounds = (page.rect * matrix).irect
+            x = bounds.x0 + (bounds.width - width) // 2
+            y = bounds.y0 + (bounds.height - height) // 2
+            device = fitz.IRect(box[0] + x, box[1] + y, box[2] + x, box[3] + y)
+            pix = page.get_pixmap(matrix=matrix, clip=fitz.Rect(device) * ~matrix)
+            
+            img = Image.new("RGB", (device.width, device.height), (255, 255, 255))
+            img.paste(Image.frombytes("RGB", [pix.width, pix.height], pix.samples),
+                      (pix.x - device.x0, pix.y - device.y0))
+        # PIL's luma weights, not MuPDF's ICC gray, keep the familiar look
+        if mode != img.mode:
+            img = img.convert(mode)
         return img
         
     @staticmethod
-    def add_rotation(img, max_angle=1.5):
+    def add_rotation(img, max_angle=1.5, rng=None):
         """Add slight random rotation"""
-        angle = random.uniform(-max_angle, max_angle)
+        if rng is None:
+            rng = np.random.default_rng()
+        angle = rng.uniform(-max_angle, max_angle)
         return img.rotate(angle, resample=Image.BICUBIC, expand=True)
     
     @staticmethod
@@ -54,69 +163,252 @@ class PDFScannerEffects:
         return img.convert('L').convert('RGB')
         
     @staticmethod
-    def convert_to_black_and_white(img, threshold=200):
-        """Convert to black and white with threshold"""
+    def threshold_table(threshold=200):
+        """Lookup table mapping gray levels below threshold to black and the rest to white"""
+        return [0] * threshold + [255] * (256 - threshold)
+    
+    @staticmethod
+    def convert_to_black_and_white(img, threshold=200, method="global", window=31):
+        """Convert to black and white with a global threshold or an adaptive method"""
         gray = img.convert('L')
-        return gray.point(lambda x: 0 if x < threshold else 255, '1').convert('RGB')
+        if method != "global":
+            return Image.fromarray(PDFScannerEffects.adaptive_threshold(gray, method, window)).convert('RGB')
+        return gray.point(PDFScannerEffects.threshold_table(threshold), '1').convert('RGB')
     
     @staticmethod
-    def add_noise(img, factor=10):
-        """Add random noise"""
-        noise = Image.new('RGB', img.size, (0, 0, 0))
-        draw = ImageDraw.Draw(noise)
+    def box_sums(values, window):
+        """Sum of values over a window x window box around each pixel, clipped at the edges
+        
+        Uses an integral image, built as two cumulative sums, so the cost
+        is linear in the pixel count whatever the window size.
+        """
+        half = window // 2
+        height, width = values.shape
+        # Zero padding clips the boxes at the edges; the integral image has a leading zero row and column
+        integral = np.zeros((height + 2 * half + 1, width), dtype=np.int64)
+        np.cumsum(values, axis=0, out=integral[half + 1:height + half + 1])
+        integral[height + half + 1:] = integral[height + half]
+        columns = integral[window:] - integral[:-window]
+        integral = np.zeros((height, width + 2 * half + 1), dtype=np.int64)
+        np.cumsum(columns, axis=1, out=integral[:, half + 1:width + half + 1])
+        integral[:, width + half + 1:] = integral[:, width + half:width + half + 1]
+        return integral[:, window:] - integral[:, :-window]
+    
+    @staticmethod
+    def adaptive_threshold(gray, method="sauvola", window=31, k=None):
+        """Boolean white mask of an 'L' image from local mean and deviation
         
+        sauvola: T = m * (1 + k * (s / 128 - 1)), k = 0.2 by default
+        niblack: T = m + k * s, k = -0.2 by default
+        with m and s the mean and standard deviation over the window, so
+        shading and shadows raise the threshold locally instead of turning
+        black.
+        """
+        values = np.asarray(gray, dtype=np.int64)
+        height, width = values.shape
+        half = window // 2
+        rows = np.minimum(np.arange(height) + half + 1, height) - np.maximum(np.arange(height) - half, 0)
+        cols = np.minimum(np.arange(width) + half + 1, width) - np.maximum(np.arange(width) - half, 0)
+        count = np.outer(rows, cols)
+        
+        mean = PDFScannerEffects.box_sums(values, window) / count
+        variance = PDFScannerEffects.box_sums(values * values, window) / count - mean * mean
+        deviation = np.sqrt(np.maximum(variance, 0, out=variance), out=variance)
+        if method == "sauvola":
+            threshold = mean * (1 + (0.2 if k is None else k) * (deviation / 128 - 1))
+        elif method == "niblack":
+            threshold = mean + (-0.2 if k is None else k) * deviation
+        else:
+            raise ValueError(f"Unknown black and white method: {method}")
+        return values >= threshold
+    
+    @staticmethod
+    def encode_group4(img):
+        """CCITT Group 4 data of a 1-bit image, as a PDF CCITTFaxDecode stream holds it"""
+        tiff = io.BytesIO()
+        # One strip for the whole image, so its data is a single G4 stream
+        img.save(tiff, format="TIFF", compression="group4", tiffinfo={278: img.height})
+        with Image.open(tiff) as parsed:
+            offset, size = parsed.tag_v2[273][0], parsed.tag_v2[279][0]
+        return tiff.getvalue()[offset:offset + size]
+    
+    @staticmethod
+    def add_noise(img, factor=10, rng=None):
+        """Add random noise"""
+        if rng is None:
+            rng = np.random.default_rng()
         width, height = img.size
-        for x in range(0, width, 2):
-            for y in range(0, height, 2):
-                if random.randint(0, 100) < factor:
-                    noise_value = random.randint(0, 50)
-                    draw.point((x, y), fill=(noise_value, noise_value, noise_value))
+        
+        # Noise is sampled on every other pixel in both directions
+        grid = ((height + 1) // 2, (width + 1) // 2)
+        hits = rng.random(grid) < factor / 101
+        values = rng.integers(0, 50, size=grid, endpoint=True, dtype=np.uint8)
+        
+        noise = np.zeros((height, width), dtype=np.uint8)
+        noise[::2, ::2] = np.where(hits, values, 0)
+        noise = Image.fromarray(noise)
+        if img.mode != noise.mode:
+            noise = noise.convert(img.mode)
         
         return Image.blend(img, noise, 0.1)
     
     @staticmethod
-    def add_fold_marks(img, count=1):
-        """Add fold marks"""
-        draw = ImageDraw.Draw(img)
-        width, height = img.size
+    def plan_fold_marks(width, height, count=1, rng=None):
+        """Pick the crease points of fold marks on a page of the given size
+        
+        Returns a list of (xs, ys, intensity) arrays in page pixels.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        folds = []
         
         for _ in range(count):
             # Horizontal or vertical fold
-            if random.choice([True, False]):
+            if rng.integers(2):
                 # Horizontal fold
-                y = random.randint(height // 4, 3 * height // 4)
-                for x in range(0, width, 2):
-                    y_var = y + random.randint(-2, 2)
-                    intensity = random.randint(150, 230)
-                    draw.point((x, y_var), fill=(intensity, intensity, intensity))
+                y = rng.integers(height // 4, 3 * height // 4, endpoint=True)
+                xs = np.arange(0, width, 2)
+                ys = y + rng.integers(-2, 2, size=xs.size, endpoint=True)
             else:
                 # Vertical fold
-                x = random.randint(width // 4, 3 * width // 4)
-                for y in range(0, height, 2):
-                    x_var = x + random.randint(-2, 2)
-                    intensity = random.randint(150, 230)
-                    draw.point((x_var, y), fill=(intensity, intensity, intensity))
+                x = rng.integers(width // 4, 3 * width // 4, endpoint=True)
+                ys = np.arange(0, height, 2)
+                xs = x + rng.integers(-2, 2, size=ys.size, endpoint=True)
+            intensity = rng.integers(150, 230, size=xs.size, endpoint=True, dtype=np.uint8)
+            folds.append((xs, ys, intensity))
         
-        return img
+        return folds
     
     @staticmethod
-    def add_edge_shadow(img):
-        """Add subtle shadow near edges"""
-        width, height = img.size
-        shadow = Image.new('RGB', (width, height), (255, 255, 255))
-        draw = ImageDraw.Draw(shadow)
+    def draw_fold_marks(img, folds, offset=(0, 0)):
+        """Draw planned fold marks onto an image placed at offset on its page"""
+        pixels = np.array(img)
+        height, width = pixels.shape[:2]
+        
+        for xs, ys, intensity in folds:
+            xs = xs - offset[0]
+            ys = ys - offset[1]
+            # Jitter can push a point off the page, just like ImageDraw clipping
+            inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+            if pixels.ndim == 3:
+                pixels[ys[inside], xs[inside]] = intensity[inside, None]
+            else:
+                pixels[ys[inside], xs[inside]] = intensity[inside]
+        
+        return Image.fromarray(pixels)
+    
+    @staticmethod
+    def add_fold_marks(img, count=1, rng=None):
+        """Add fold marks"""
+        folds = PDFScannerEffects.plan_fold_marks(img.width, img.height, count, rng)
+        return PDFScannerEffects.draw_fold_marks(img, folds)
+    
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def edge_shadow_profile(width, height):
+        """Edge shadow levels of a page of the given size
         
+        Along an edge the shadow only depends on the distance to that edge,
+        so it is stored as one level per column and per row, plus the
+        rounded top-left corner block that the 2-D blur produces. Returns
+        (columns, rows, corner, band), band being the depth beyond which
+        the mask is plain white.
+        """
         edge_width = int(min(width, height) * 0.03)
+        columns = np.full(width, 255, dtype=np.uint8)
+        rows = np.full(height, 255, dtype=np.uint8)
+        if edge_width == 0:
+            return columns, rows, None, 0
         
-        for i in range(edge_width):
-            opacity = int(200 * (edge_width - i) / edge_width)
-            draw.rectangle(
-                [(i, i), (width - i, height - i)],
-                outline=(255 - opacity, 255 - opacity, 255 - opacity)
-            )
+        # Blur the corner of the nested rectangle outlines once; its last
+        # row is far enough from the corner to be the plain edge profile
+        radius = edge_width / 2
+        band = min(edge_width + int(np.ceil(3 * radius)), min(width, height) // 2)
+        depth = np.arange(band + int(np.ceil(3 * radius)))
+        ramp = np.where(depth < edge_width, 255 - (200 * (edge_width - depth)) // edge_width, 255)
+        outlines = ramp[np.minimum.outer(depth, depth)].astype(np.uint8)
+        block = np.array(Image.fromarray(outlines).filter(ImageFilter.GaussianBlur(radius=radius)))
+        profile = block[-1, :band]
         
-        shadow = shadow.filter(ImageFilter.GaussianBlur(radius=edge_width/2))
-        return Image.blend(img, shadow, 0.3)
+        for levels in (columns, rows):
+            levels[:band] = profile
+            levels[len(levels) - band:] = np.minimum(levels[len(levels) - band:], profile[::-1])
+        return columns, rows, block[:band, :band], band
+    
+    @staticmethod
+    def edge_shadow_mask(width, height, box):
+        """Edge shadow mask of a page of the given size, cropped to box"""
+        columns, rows, corner, band = PDFScannerEffects.edge_shadow_profile(width, height)
+        left, top, right, bottom = box
+        mask = np.minimum(rows[top:bottom, None], columns[None, left:right])
+        if corner is None:
+            return Image.fromarray(mask)
+        
+        corners = (
+            (0, 0, corner),
+            (width - band, 0, corner[:, ::-1]),
+            (0, height - band, corner[::-1]),
+            (width - band, height - band, corner[::-1, ::-1]),
+        )
+        for x, y, patch in corners:
+            x0, x1 = max(left, x), min(right, x + band)
+            y0, y1 = max(top, y), min(bottom, y + band)
+            if x0 < x1 and y0 < y1:
+                mask[y0 - top:y1 - top, x0 - left:x1 - left] = patch[y0 - y:y1 - y, x0 - x:x1 - x]
+        return Image.fromarray(mask)
+    
+    @staticmethod
+    def edge_shadow_band_boxes(width, height):
+        """Boxes of the border bands outside which the edge shadow mask is white"""
+        band = PDFScannerEffects.edge_shadow_profile(width, height)[3]
+        if band == 0:
+            return []
+        boxes = [
+            (0, 0, width, band),
+            (0, height - band, width, height),
+            (0, band, band, height - band),
+            (width - band, band, width, height - band),
+        ]
+        return [box for box in boxes if box[2] > box[0] and box[3] > box[1]]
+    
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def edge_shadow_bands(width, height, mode):
+        """Border bands of the edge shadow mask as (box, image) pairs"""
+        return tuple(
+            (box, PDFScannerEffects.edge_shadow_mask(width, height, box).convert(mode))
+            for box in PDFScannerEffects.edge_shadow_band_boxes(width, height)
+        )
+    
+    @staticmethod
+    def add_edge_shadow(img, page_size=None, offset=(0, 0)):
+        """Add subtle shadow near edges
+        
+        page_size and offset place img on a larger page, for tiles. Whole
+        pages use the cached bands; tiles build only their own part of them
+        from the 1-D profiles, so memory does not grow with the page size.
+        """
+        width, height = page_size or img.size
+        left, top = offset
+        if page_size is None:
+            bands = PDFScannerEffects.edge_shadow_bands(width, height, img.mode)
+        else:
+            bands = [(box, None) for box in PDFScannerEffects.edge_shadow_band_boxes(width, height)]
+        
+        # Away from the edges the mask is white, so the blend is a lookup table
+        table = [round(v * 0.7 + 255 * 0.3) for v in range(256)] * len(img.getbands())
+        result = img.point(table)
+        for box, shadow in bands:
+            x0, y0 = max(box[0], left), max(box[1], top)
+            x1, y1 = min(box[2], left + img.width), min(box[3], top + img.height)
+            if x0 < x1 and y0 < y1:
+                region = (x0 - left, y0 - top, x1 - left, y1 - top)
+                if shadow is None:
+                    part = PDFScannerEffects.edge_shadow_mask(width, height, (x0, y0, x1, y1)).convert(img.mode)
+                else:
+                    part = shadow.crop((x0 - box[0], y0 - box[1], x1 - box[0], y1 - box[1]))
+                result.paste(Image.blend(img.crop(region), part, 0.3), region)
+        return result
     
     @staticmethod
     def apply_blur(img, radius=0.5):
@@ -126,9 +418,24 @@ class PDFScannerEffects:
         return img
     
     @staticmethod
-    def create_scanner_metadata(scanner_name="HP ScanJet Pro 3000"):
-        """Create metadata to simulate a scan"""
-        now = datetime.now()
+    def create_scanner_metadata(scanner_name="HP ScanJet Pro 3000", seed=None, digest=None):
+        """Create metadata to simulate a scan of the document with the given digest
+        
+        With a seed the UUID is derived from it and the digest, and
+        SOURCE_DATE_EPOCH fixes the scan time when set, so seeded runs can
+        produce identical files while different documents keep distinct UUIDs.
+        """
+        if "SOURCE_DATE_EPOCH" in os.environ:
+            now = datetime.fromtimestamp(int(os.environ["SOURCE_DATE_EPOCH"]), tz=timezone.utc)
+        else:
+            now = datetime.now()
+        if seed is None:
+            scan_uuid = uuid.uuid4()
+        else:
+            entropy = [seed]
+            if digest is not None:
+                entropy.append(int(digest, 16))
+            scan_uuid = uuid.UUID(bytes=np.random.default_rng(entropy).bytes(16), version=4)
         return {
             "/Creator": scanner_name,
             "/Producer": f"{scanner_name} Software 3.12.4",
@@ -138,433 +445,1271 @@ class PDFScannerEffects:
             "/ScanningApplication": "HP Smart",
             "/ScanDate": now.strftime("%Y-%m-%d"),
             "/ScanTime": now.strftime("%H:%M:%S"),
-            "/UUID": str(uuid.uuid4()),
+            "/UUID": str(scan_uuid),
         }
     
     @staticmethod
-    def process_pdf(input_pdf, output_pdf, options):
-        """Process PDF with scanning effects"""
-        input_doc = fitz.open(input_pdf)
-        pdf_writer = PdfWriter()
+    def open_document(source):
+        """Open a PDF given as a path or as raw bytes"""
+        if isinstance(source, (bytes, bytearray)):
+            return fitz.open(stream=source, filetype="pdf")
+        return fitz.open(source)
+    
+    @staticmethod
+    def document_digest(input_pdf):
+        """SHA-256 hex digest of a PDF given as a path or raw bytes"""
+        digest = hashlib.sha256()
+        if isinstance(input_pdf, (bytes, bytearray)):
+            digest.update(input_pdf)
+        else:
+            with open(input_pdf, "rb") as f:
+                for block in iter(lambda: f.read(2**20), b""):
+                    digest.update(block)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def inspect_source(input_pdf, options, cache=None, name="<input>"):
+        """Describe a PDF given as a path or raw bytes as a PageSource"""
+        data = input_pdf if isinstance(input_pdf, (bytes, bytearray)) else None
+        digest = PDFScannerEffects.document_digest(input_pdf)
+        with PDFScannerEffects.open_document(input_pdf) as doc:
+            page_count = len(doc)
+            cache_keys = [cache.key(doc, page_num, options, digest) for page_num in range(page_count)] if cache else None
+        return PageSource(name if data is not None else input_pdf, data, page_count, cache_keys, digest)
+    
+    @staticmethod
+    def stage(hooks, name, page_num, document=None):
+        """Context manager timing a stage with options['hooks'], if any"""
+        if hooks is None:
+            return nullcontext()
+        return hooks.stage(name, page_num, document)
+    
+    @staticmethod
+    def iter_pages(sources, options, cancel=None, journal=None):
+        """Process the pages of several documents, yielding them in order
         
-        for page_num in range(len(input_doc)):
-            page = input_doc[page_num]
-            
-            # Convert to image
-            img = PDFScannerEffects.convert_page_to_image(page, dpi=options.get('dpi', 150))
-            
-            # Apply effects
-            if options.get('rotate', True):
-                img = PDFScannerEffects.add_rotation(img, max_angle=options.get('max_rotation', 1.5))
-            
-            if options.get('grayscale', True):
-                img = PDFScannerEffects.convert_to_grayscale(img)
-            
-            if options.get('bw', False):
-                img = PDFScannerEffects.convert_to_black_and_white(img)
-            
-            if options.get('add_noise', True):
-                img = PDFScannerEffects.add_noise(img)
-            
-            if options.get('fold_marks', True):
-                img = PDFScannerEffects.add_fold_marks(img, count=options.get('fold_count', 1))
-            
-            if options.get('add_shadow', True):
-                img = PDFScannerEffects.add_edge_shadow(img)
-            
-            if options.get('blur', 0.5) > 0:
-                img = PDFScannerEffects.apply_blur(img, radius=options.get('blur', 0.5))
-            
-            # Convert back to PDF
-            img_bytes = io.BytesIO()
-            img.save(img_bytes, format="JPEG", quality=options.get('quality', 85))
-            img_bytes.seek(0)
-            
-            # Create a temporary PDF with the image
-            temp_pdf = fitz.open()
-            img_rectangle = fitz.Rect(0, 0, img.width, img.height)
-            new_page = temp_pdf.new_page(width=img.width, height=img.height)
-            new_page.insert_image(img_rectangle, stream=img_bytes)
-            
-            # Save temporary PDF but don't attempt deletion
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-            temp_file_name = temp_file.name
-            temp_file.close()
-            temp_pdf.save(temp_file_name)
-            temp_pdf.close()
-            
-            # Add page to output PDF
-            temp_reader = PdfReader(temp_file_name)
-            pdf_writer.add_page(temp_reader.pages[0])
-            
-            # No cleanup - just leave the temp file
+        Yields (source_index, page_num, result) for every page of every
+        PageSource, where result is the EncodedPage or the exception raised
+        for that page. Pages come from the PageCache, the CheckpointJournal
+        journal or the worker pool (a WarmPagePool as options['pool']), with
+        at most two pages per worker in flight (options['max_resident_pages']
+        in streaming mode). Raises ProcessingCancelled once cancel is set.
+        """
+        workers = options.get('workers', 1) or os.cpu_count()
+        cache = PageCache.from_options(options)
+        documents = {source.name: source.data for source in sources if source.data is not None}
+        tasks = [(index, page_num) for index, source in enumerate(sources) for page_num in range(source.page_count)]
         
-        # Set metadata
-        metadata = PDFScannerEffects.create_scanner_metadata(options.get('scanner_name', 'HP ScanJet Pro 3000'))
-        pdf_writer.add_metadata(metadata)
+        hooks = options.get('hooks')
         
-        # Save output PDF
-        with open(output_pdf, "wb") as f:
-            pdf_writer.write(f)
+        def cached(index, page_num):
+            if journal is not None:
+                with PDFScannerEffects.stage(hooks, "checkpoint", page_num, sources[index].name):
+                    page = journal.get(page_num)
+                if page is not None:
+                    return page
+            keys = sources[index].cache_keys
+            if not (cache and keys):
+                return None
+            with PDFScannerEffects.stage(hooks, "cache", page_num, sources[index].name):
+                return cache.get(keys[page_num])
         
-        input_doc.close()
-
-class ScannerApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("PDF Scanner Effect Creator")
-        self.root.geometry("800x800")
-        
-        self.input_pdf = tk.StringVar()
-        self.output_pdf = tk.StringVar()
-        self.dpi = tk.IntVar(value=150)
-        self.rotate = tk.BooleanVar(value=True)
-        self.max_rotation = tk.DoubleVar(value=1.5)
-        self.grayscale = tk.BooleanVar(value=True)
-        self.bw = tk.BooleanVar(value=False)
-        self.add_noise = tk.BooleanVar(value=True)
-        self.fold_marks = tk.BooleanVar(value=True)
-        self.fold_count = tk.IntVar(value=1)
-        self.quality = tk.IntVar(value=85)
-        self.scanner_name = tk.StringVar(value="HP ScanJet Pro 3000")
-        self.add_shadow = tk.BooleanVar(value=True)
-        self.blur = tk.DoubleVar(value=0.5)
-        
-        # Preview variables
-        self.pdf_doc = None
-        self.current_page = 0
-        self.total_pages = 0
-        self.preview_image = None
-        self.original_image = None
-        self.effects_applied = False
-        
-        self.create_widgets()
-    
-    def create_widgets(self):
-        # Main container with paned window
-        main_paned = ttk.PanedWindow(self.root, orient=tk.HORIZONTAL)
-        main_paned.pack(fill="both", expand=True, padx=10, pady=10)
-        
-        # Left frame for controls
-        left_frame = ttk.Frame(main_paned)
-        main_paned.add(left_frame, weight=1)
-        
-        # Right frame for preview
-        right_frame = ttk.LabelFrame(main_paned, text="PDF Preview")
-        main_paned.add(right_frame, weight=1)
-        
-        # File selection frame
-        file_frame = ttk.LabelFrame(left_frame, text="File Selection")
-        file_frame.pack(fill="x", padx=5, pady=5)
-        
-        ttk.Label(file_frame, text="Input PDF:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
-        ttk.Entry(file_frame, textvariable=self.input_pdf, width=30).grid(row=0, column=1, padx=5, pady=5)
-        ttk.Button(file_frame, text="Browse...", command=self.browse_input).grid(row=0, column=2, padx=5, pady=5)
-        
-        ttk.Label(file_frame, text="Output PDF:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
-        ttk.Entry(file_frame, textvariable=self.output_pdf, width=30).grid(row=1, column=1, padx=5, pady=5)
-        ttk.Button(file_frame, text="Browse...", command=self.browse_output).grid(row=1, column=2, padx=5, pady=5)
-        
-        # Options frame
-        options_frame = ttk.LabelFrame(left_frame, text="Scanning Effect Options")
-        options_frame.pack(fill="both", expand=True, padx=5, pady=5)
-        
-        # Basic options
-        ttk.Checkbutton(options_frame, text="Add rotation", variable=self.rotate).grid(row=0, column=0, sticky=tk.W, padx=5, pady=2)
-        ttk.Label(options_frame, text="Max rotation:").grid(row=0, column=1, sticky=tk.W, padx=5, pady=2)
-        ttk.Scale(options_frame, from_=0.1, to=5.0, variable=self.max_rotation, orient=tk.HORIZONTAL, length=100).grid(row=0, column=2, padx=5, pady=2)
-        
-        ttk.Checkbutton(options_frame, text="Grayscale", variable=self.grayscale).grid(row=1, column=0, sticky=tk.W, padx=5, pady=2)
-        ttk.Checkbutton(options_frame, text="Black & White", variable=self.bw).grid(row=1, column=1, sticky=tk.W, padx=5, pady=2)
-        
-        ttk.Checkbutton(options_frame, text="Add noise", variable=self.add_noise).grid(row=2, column=0, sticky=tk.W, padx=5, pady=2)
-        ttk.Checkbutton(options_frame, text="Add shadow", variable=self.add_shadow).grid(row=2, column=1, sticky=tk.W, padx=5, pady=2)
-        
-        ttk.Checkbutton(options_frame, text="Add fold marks", variable=self.fold_marks).grid(row=3, column=0, sticky=tk.W, padx=5, pady=2)
-        ttk.Label(options_frame, text="Folds:").grid(row=3, column=1, sticky=tk.W, padx=5, pady=2)
-        ttk.Spinbox(options_frame, from_=1, to=5, textvariable=self.fold_count, width=5).grid(row=3, column=2, sticky=tk.W, padx=5, pady=2)
-        
-        ttk.Label(options_frame, text="DPI:").grid(row=4, column=0, sticky=tk.W, padx=5, pady=2)
-        ttk.Scale(options_frame, from_=72, to=300, variable=self.dpi, orient=tk.HORIZONTAL, length=150).grid(row=4, column=1, columnspan=2, padx=5, pady=2)
-        
-        ttk.Label(options_frame, text="Quality:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=2)
-        ttk.Scale(options_frame, from_=50, to=100, variable=self.quality, orient=tk.HORIZONTAL, length=150).grid(row=5, column=1, columnspan=2, padx=5, pady=2)
-        
-        ttk.Label(options_frame, text="Blur:").grid(row=6, column=0, sticky=tk.W, padx=5, pady=2)
-        ttk.Scale(options_frame, from_=0, to=2.0, variable=self.blur, orient=tk.HORIZONTAL, length=150).grid(row=6, column=1, columnspan=2, padx=5, pady=2)
-        
-        # Scanner name frame
-        scanner_frame = ttk.Frame(options_frame)
-        scanner_frame.grid(row=7, column=0, columnspan=3, sticky="ew", padx=5, pady=5)
-        
-        ttk.Label(scanner_frame, text="Scanner:").pack(side=tk.LEFT)
-        ttk.Entry(scanner_frame, textvariable=self.scanner_name, width=25).pack(side=tk.LEFT, padx=5)
-        ttk.Button(scanner_frame, text="Random", command=self.randomize_scanner).pack(side=tk.LEFT, padx=5)
-        
-        # Progress bar
-        self.progress = ttk.Progressbar(left_frame, orient=tk.HORIZONTAL, mode='determinate')
-        self.progress.pack(fill="x", padx=5, pady=5)
-        
-        # Status label
-        self.status_var = tk.StringVar(value="Ready")
-        self.status_label = ttk.Label(left_frame, textvariable=self.status_var)
-        self.status_label.pack(padx=5, pady=2)
-        
-        # Action buttons
-        button_frame = ttk.Frame(left_frame)
-        button_frame.pack(fill="x", padx=5, pady=5)
-        
-        ttk.Button(button_frame, text="Create Scanned PDF", command=self.process_pdf_threaded).pack(side=tk.RIGHT, padx=2)
-        ttk.Button(button_frame, text="Exit", command=self.root.quit).pack(side=tk.RIGHT, padx=2)
-        
-        # Preview section
-        self.setup_preview(right_frame)
-    
-    def setup_preview(self, parent):
-        """Setup the PDF preview section"""
-        # Preview controls
-        control_frame = ttk.Frame(parent)
-        control_frame.pack(fill="x", padx=5, pady=5)
+        def finish(index, page_num, result):
+            if not isinstance(result, Future):
+                return index, page_num, result
+            try:
+                encoded = result.result()
+            except Exception as error:
+                return index, page_num, error
+            if hooks is not None and encoded.profile:
+                hooks.merge(encoded.profile, sources[index].name)
+            if cache and sources[index].cache_keys:
+                cache.put(sources[index].cache_keys[page_num], encoded)
+            return index, page_num, encoded
         
-        self.prev_button = ttk.Button(control_frame, text="◀ Previous", command=self.prev_page, state="disabled")
-        self.prev_button.pack(side=tk.LEFT, padx=2)
+        pool = options.get('pool')
+        if pool is None and (workers <= 1 or len(tasks) <= 1):
+            worker = PageWorker(options, documents, cancel)
+            try:
+                for index, page_num in tasks:
+                    if cancel is not None:
+                        cancel.check()
+                    result = cached(index, page_num)
+                    if result is None:
+                        result = Future()
+                        try:
+                            result.set_result(worker.process(sources[index].name, page_num, sources[index].digest))
+                        except ProcessingCancelled:
+                            raise
+                        except Exception as error:
+                            result.set_exception(error)
+                    yield finish(index, page_num, result)
+            finally:
+                worker.close()
+            return
         
-        self.page_label = ttk.Label(control_frame, text="No PDF loaded")
-        self.page_label.pack(side=tk.LEFT, expand=True)
+        if pool is not None:
+            workers = pool.workers
+            spooled = [pool.spool(source) for source in sources]
+            submit = lambda index, page_num: pool.submit(options, spooled[index], page_num)
+        else:
+            workers = min(workers, len(tasks))
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker,
+                                           initargs=(options, documents))
+            submit = lambda index, page_num: executor.submit(_process_page_worker, sources[index].name, page_num,
+                                                             sources[index].digest)
+        if options.get('stream', False):
+            max_pending = max(1, options.get('max_resident_pages', 4))
+        else:
+            max_pending = workers * 2
+        pending = deque()
+        try:
+            for index, page_num in tasks:
+                if cancel is not None:
+                    cancel.check()
+                # Cache hits skip the pool but keep their place in page order
+                result = cached(index, page_num)
+                if result is None:
+                    result = submit(index, page_num)
+                pending.append((index, page_num, result))
+                if len(pending) >= max_pending:
+                    yield finish(*pending.popleft())
+            while pending:
+                if cancel is not None:
+                    cancel.check()
+                yield finish(*pending.popleft())
+        finally:
+            # Pages nobody will collect any more are not worth finishing or waiting for
+            if pool is None:
+                executor.shutdown(wait=not pending, cancel_futures=True)
+            else:
+                for _, _, result in pending:
+                    if isinstance(result, Future):
+                        result.cancel()
+                for source in spooled:
+                    pool.release(source)
+    
+    @staticmethod
+    def apply_metadata(doc, metadata):
+        """Write metadata into the document information dictionary of a fitz document"""
+        info = doc.xref_get_key(-1, "Info")
+        if info[0] == "xref":
+            info_xref = int(info[1].split()[0])
+        else:
+            info_xref = doc.get_new_xref()
+            doc.update_object(info_xref, "<<>>")
+            doc.xref_set_key(-1, "Info", f"{info_xref} 0 R")
         
-        self.preview_effects_button = ttk.Button(control_frame, text="Preview Effects", command=self.preview_effects, state="disabled")
-        self.preview_effects_button.pack(side=tk.RIGHT, padx=2)
+        for key, value in metadata.items():
+            doc.xref_set_key(info_xref, key.lstrip("/"), fitz.get_pdf_str(value))
+    
+    @staticmethod
+    def open_writer(output_pdf, options):
+        """Page writer for a path or binary file object, streaming if options['stream']"""
+        if options.get('stream', False):
+            if hasattr(output_pdf, 'write'):
+                return StreamingPDFWriter(output_pdf)
+            return StreamingPDFWriter(path=output_pdf)
+        return DocumentPDFWriter(output_pdf, deterministic=options.get('seed') is not None)
+    
+    @staticmethod
+    def process_pdf(input_pdf, output_pdf, options, progress=None, cancel=None):
+        """Process PDF with scanning effects
         
-        self.next_button = ttk.Button(control_frame, text="Next ▶", command=self.next_page, state="disabled")
-        self.next_button.pack(side=tk.RIGHT, padx=2)
+        input_pdf and output_pdf are paths or binary file objects. With
+        options['stream'] every page is written to the output as soon as it
+        is finished instead of being collected in memory first.
         
-        # Preview canvas
-        self.preview_canvas = tk.Canvas(parent, bg="white", width=300, height=400)
-        self.preview_canvas.pack(fill="both", expand=True, padx=5, pady=5)
+        progress(done, total, eta) is called as pages finish. When the
+        CancelToken cancel is set, the pages done so far are written as a
+        shorter but complete PDF and ProcessingCancelled is raised. Returns
+        the number of pages written.
         
-        # Scrollbars for canvas
-        v_scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.preview_canvas.yview)
-        v_scrollbar.pack(side="right", fill="y")
-        h_scrollbar = ttk.Scrollbar(parent, orient="horizontal", command=self.preview_canvas.xview)
-        h_scrollbar.pack(side="bottom", fill="x")
+        With options['checkpoint_dir'] every finished page is also kept in
+        a CheckpointJournal there, and with options['resume'] a run that
+        was interrupted continues from the pages recorded in it.
+        """
+        if hasattr(input_pdf, 'read'):
+            input_pdf = input_pdf.read()
+        scanner_name = options.get('scanner_name', 'HP ScanJet Pro 3000')
+        hooks = options.get('hooks')
         
-        self.preview_canvas.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
-    
-    def randomize_scanner(self):
-        """Randomize the scanner name from the predefined list"""
-        random_scanner = random.choice(PDFScannerEffects.PRINTER_NAMES)
-        self.scanner_name.set(random_scanner)
-    
-    def load_pdf_preview(self, pdf_path):
-        """Load PDF for preview"""
+        source = PDFScannerEffects.inspect_source(input_pdf, options, PageCache.from_options(options))
+        metadata = PDFScannerEffects.create_scanner_metadata(scanner_name, options.get('seed'), source.digest)
+        journal = None
+        if options.get('checkpoint_dir'):
+            journal = CheckpointJournal(options['checkpoint_dir'])
+            metadata = journal.start(source.digest, options, source.page_count, metadata, options.get('resume', False))
+        reporter = ProgressReporter(source.page_count, progress)
+        writer = PDFScannerEffects.open_writer(output_pdf, options)
         try:
-            if self.pdf_doc:
-                self.pdf_doc.close()
-            
-            self.pdf_doc = fitz.open(pdf_path)
-            self.total_pages = len(self.pdf_doc)
-            self.current_page = 0
-            
-            if self.total_pages > 0:
-                self.update_preview()
-                self.prev_button.config(state="normal" if self.total_pages > 1 else "disabled")
-                self.next_button.config(state="normal" if self.total_pages > 1 else "disabled")
-                self.preview_effects_button.config(state="normal")
+            for _, page_num, result in PDFScannerEffects.iter_pages([source], options, cancel, journal):
+                if isinstance(result, Exception):
+                    raise result
+                if journal is not None:
+                    with PDFScannerEffects.stage(hooks, "checkpoint", page_num, source.name):
+                        journal.record(page_num, result)
+                with PDFScannerEffects.stage(hooks, "assemble", page_num, source.name):
+                    writer.add_page(result)
+                reporter.advance()
+        except ProcessingCancelled:
+            if reporter.done:
+                writer.close(metadata)
             else:
-                self.page_label.config(text="Empty PDF")
-                
-        except Exception as e:
-            messagebox.showerror("Preview Error", f"Could not load PDF preview: {str(e)}")
-            self.page_label.config(text="Preview not available")
-    
-    def update_preview(self, force_original=False):
-        """Update the preview with current page"""
-        if not self.pdf_doc or self.current_page >= self.total_pages:
-            return
+                writer.abort()
+            raise ProcessingCancelled(reporter.done)
+        except BaseException:
+            writer.abort()
+            raise
+        with PDFScannerEffects.stage(hooks, "assemble", None, source.name):
+            writer.close(metadata)
+        if journal is not None:
+            journal.clear()
+        return reporter.done
+    
+    @staticmethod
+    def collect_batch_jobs(source, output_dir=None):
+        """Expand a directory, glob pattern or manifest file into (input, output) pairs
+        
+        A manifest lists one input PDF per line, optionally followed by a
+        tab and its output path; blank lines and lines starting with # are
+        skipped. Outputs default to <name>_scanned.pdf in output_dir, or
+        next to the input.
+        """
+        if os.path.isdir(source):
+            pairs = [(path, None) for path in sorted(glob.glob(os.path.join(source, "*.pdf")))]
+        elif any(char in source for char in "*?["):
+            pairs = [(path, None) for path in sorted(glob.glob(source))]
+        else:
+            pairs = []
+            with open(source, encoding="utf-8") as manifest:
+                for line in manifest:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        input_pdf, _, output_pdf = line.partition("\t")
+                        pairs.append((input_pdf.strip(), output_pdf.strip() or None))
+        
+        jobs = []
+        for input_pdf, output_pdf in pairs:
+            if output_pdf is None:
+                base, ext = os.path.splitext(os.path.basename(input_pdf))
+                directory = output_dir if output_dir is not None else os.path.dirname(input_pdf)
+                output_pdf = os.path.join(directory, f"{base}_scanned{ext}")
+            jobs.append((input_pdf, output_pdf))
+        return jobs
+    
+    @staticmethod
+    def process_batch(jobs, options, progress=None, cancel=None):
+        """Process many PDFs on one shared worker pool
+        
+        jobs is a list of (input_pdf, output_pdf) paths. The pages of all
+        documents are scheduled onto the same pool, largest documents
+        first, so cores stay busy however small the files are. A failing
+        document does not stop the others. progress and cancel work as in
+        process_pdf over the pages of all documents; on cancellation the
+        documents in progress are written as far as they got. Returns one
+        summary dict per job, in job order.
+        """
+        started = time.monotonic()
+        cache = PageCache.from_options(options)
+        scanner_name = options.get('scanner_name', 'HP ScanJet Pro 3000')
+        hooks = options.get('hooks')
+        summaries, work = [], []
+        
+        for input_pdf, output_pdf in jobs:
+            summary = {"input": input_pdf, "output": output_pdf, "status": "pending", "pages": 0}
+            summaries.append(summary)
+            try:
+                source = PDFScannerEffects.inspect_source(input_pdf, options, cache)
+            except Exception as error:
+                summary.update(status="error", error=str(error))
+                continue
+            summary["pages"] = source.page_count
+            if source.page_count == 0:
+                summary.update(status="error", error="document has no pages")
+                continue
+            work.append((source, summary))
         
+        work.sort(key=lambda item: item[0].page_count, reverse=True)
+        reporter = ProgressReporter(sum(source.page_count for source, _ in work), progress)
+        writers, metadata = {}, {}
         try:
-            page = self.pdf_doc[self.current_page]
-            
-            # Convert page to image with appropriate size for preview
-            mat = fitz.Matrix(0.75, 0.75)  # Scale for preview
-            pix = page.get_pixmap(matrix=mat)
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # Store original for effects preview
-            if force_original or self.original_image is None or not self.effects_applied:
-                self.original_image = img.copy()
-                self.effects_applied = False
-            
-            # Use current image (original or with effects)
-            display_img = img
-            
-            # Convert to PhotoImage for tkinter
-            self.preview_image = ImageTk.PhotoImage(display_img)
-            
-            # Clear canvas and add image
-            self.preview_canvas.delete("all")
-            self.preview_canvas.create_image(0, 0, anchor="nw", image=self.preview_image)
-            
-            # Update scroll region
-            self.preview_canvas.configure(scrollregion=self.preview_canvas.bbox("all"))
-            
-            # Update page label
-            effects_text = " (with effects)" if self.effects_applied else ""
-            self.page_label.config(text=f"Page {self.current_page + 1} of {self.total_pages}{effects_text}")
-            
-        except Exception as e:
-            self.page_label.config(text=f"Preview error: {str(e)}")
+            for index, page_num, result in PDFScannerEffects.iter_pages([source for source, _ in work], options, cancel):
+                source, summary = work[index]
+                reporter.advance()
+                if summary["status"] == "error":
+                    continue
+                try:
+                    if isinstance(result, Exception):
+                        raise result
+                    if page_num == 0:
+                        output_dir = os.path.dirname(summary["output"])
+                        if output_dir:
+                            os.makedirs(output_dir, exist_ok=True)
+                        writers[index] = PDFScannerEffects.open_writer(summary["output"], options)
+                        # Every document is its own scan, with its own UUID and time
+                        metadata[index] = PDFScannerEffects.create_scanner_metadata(scanner_name, options.get('seed'), source.digest)
+                    with PDFScannerEffects.stage(hooks, "assemble", page_num, source.name):
+                        writers[index].add_page(result)
+                    if page_num == source.page_count - 1:
+                        with PDFScannerEffects.stage(hooks, "assemble", None, source.name):
+                            writers.pop(index).close(metadata.pop(index))
+                        summary.update(status="ok", finished_after_seconds=round(time.monotonic() - started, 3),
+                                       bytes=os.path.getsize(summary["output"]))
+                except Exception as error:
+                    summary.update(status="error", error=str(error))
+                    if index in writers:
+                        writers.pop(index).abort()
+        except ProcessingCancelled:
+            # Documents in progress keep the pages they got, as shorter PDFs
+            for index, writer in writers.items():
+                writer.close(metadata[index])
+                work[index][1].update(status="cancelled", pages_written=writer.page_count)
+            for summary in summaries:
+                if summary["status"] == "pending":
+                    summary.update(status="cancelled", pages_written=0)
+        
+        return summaries
+
+class PageWorker:
+    """Processes pages of any number of documents with one ScanPipeline
+    
+    Documents are opened on first use and the most recently used few stay
+    open, so one pool process can serve pages of many documents in turn.
+    """
+    MAX_OPEN_DOCUMENTS = 4
+    
+    def __init__(self, options, documents=None, cancel=None):
+        self.pipeline = ScanPipeline(options, cancel)
+        self.documents = documents or {}
+        self.open_docs = OrderedDict()
+    
+    def document(self, name):
+        """Open document called name, from its bytes if it was given as bytes"""
+        doc = self.open_docs.pop(name, None)
+        if doc is None:
+            doc = PDFScannerEffects.open_document(self.documents.get(name, name))
+            if len(self.open_docs) >= self.MAX_OPEN_DOCUMENTS:
+                self.open_docs.popitem(last=False)[1].close()
+        self.open_docs[name] = doc
+        return doc
+    
+    def process(self, name, page_num, digest=None):
+        """Process one page of a document with the given digest into an EncodedPage"""
+        return self.pipeline.process_page(self.document(name)[page_num], digest)
+    
+    def close(self):
+        while self.open_docs:
+            self.open_docs.popitem()[1].close()
+
+class WarmPagePool:
+    """Worker processes started once and shared by many process_pdf calls
+    
+    Given as options['pool'], it takes the pages that iter_pages would
+    otherwise send to a pool started for that call, so a long-running
+    caller pays the process startup once. The options of each call travel
+    with its pages and every worker keeps a few ScanPipelines around, one
+    per set of options it has seen recently. Documents given as bytes are
+    written once to a spool file named by their digest, which the workers
+    open by path. If a worker dies, the pool is started again on the next
+    submit.
+    """
+    MAX_PIPELINES = 4
+    
+    def __init__(self, workers=None):
+        import tempfile
+        self.workers = workers or os.cpu_count()
+        self.directory = tempfile.mkdtemp(prefix="scanner-pool-")
+        self.users = {}
+        self.lock = threading.Lock()
+        self.executor = self._start()
+    
+    def _start(self):
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Start every worker and load its libraries now rather than on the first pages
+        for future in [executor.submit(_warm_up_worker) for _ in range(self.workers)]:
+            future.result()
+        return executor
     
-    def preview_effects(self):
-        """Apply scanning effects to the current preview page"""
-        if not self.original_image:
+    def spool(self, source):
+        """PageSource to submit for source: bytes are replaced by a spool file path"""
+        if source.data is None:
+            return source
+        path = os.path.join(self.directory, source.digest + ".pdf")
+        with self.lock:
+            if path not in self.users:
+                with open(path + ".tmp", "wb") as f:
+                    f.write(source.data)
+                os.replace(path + ".tmp", path)
+            self.users[path] = self.users.get(path, 0) + 1
+        return source._replace(name=path, data=None)
+    
+    def release(self, source):
+        """Drop a source returned by spool; its file goes once nobody uses it"""
+        if source.name not in self.users:
             return
+        with self.lock:
+            self.users[source.name] -= 1
+            if self.users[source.name] == 0:
+                del self.users[source.name]
+                try:
+                    os.remove(source.name)
+                except OSError:
+                    pass
+    
+    def submit(self, options, source, page_num):
+        """Process one page of a PageSource with options; returns a Future of its EncodedPage"""
+        from concurrent.futures.process import BrokenProcessPool
+        worker_options = {name: options[name] for name in PageCache.KEY_OPTIONS if name in options}
+        with self.lock:
+            try:
+                return self.executor.submit(_process_warm_page, worker_options, source.name, page_num, source.digest)
+            except BrokenProcessPool:
+                # A worker died, say killed for memory: pages in flight fail, later ones get a new pool
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = self._start()
+                return self.executor.submit(_process_warm_page, worker_options, source.name, page_num, source.digest)
+    
+    def close(self):
+        import shutil
+        self.executor.shutdown(cancel_futures=True)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class ScanPipeline:
+    """Scanning effect chain compiled once from an options dict
+    
+    The image mode is tracked through the chain. Unless color output is
+    wanted, pages are reduced to a single 'L' channel right after rendering
+    and stay there, so every effect and the JPEG encoder work on one channel
+    instead of three identical ones. Black and white output uses a lookup
+    table and is only reduced to mode '1' when no later stage reintroduces
+    gray.
+    
+    With options['tile_size'] pages are processed in square tiles of that
+    many pixels, so no full-page bitmap is ever held.
+    
+    With options['target_size'] in bytes, for the whole document or with
+    options['target_per'] = "page" for every page, each page gets an even
+    share of it and its JPEG quality is lowered from options['quality']
+    until the page fits.
+    """
+    
+    # Lowest JPEG quality a size target may push a page to
+    MIN_QUALITY = 5
+    # Smallest tile in pixels; smaller ones spend more on clipping than they save
+    MIN_TILE_SIZE = 64
+    # Bytes of PDF structure per document and per image, left out of the image budgets
+    DOCUMENT_OVERHEAD = 4096
+    IMAGE_OVERHEAD = 640
+    
+    def __init__(self, options, cancel=None):
+        self.options = options
+        self.cancel = cancel
+        self.dpi = options.get('dpi', 150)
+        self.quality = options.get('quality', 85)
+        self.bw_mode = options.get('bw_mode') or "global"
+        self.bw = options.get('bw', False) or self.bw_mode != "global"
+        self.mode = "L" if self.bw or options.get('grayscale', True) else "RGB"
+        self.fold_count = options.get('fold_count', 1) if options.get('fold_marks', True) else 0
+        self.blur = options.get('blur', 0.5)
+        self.seed = options.get('seed')
+        self.target_size = options.get('target_size')
+        self.target_per = options.get('target_per') or "document"
+        self.hooks = options.get('hooks')
+        
+        # Tiles are kept even so the every-other-pixel noise grid lines up
+        tile_size = options.get('tile_size') or 0
+        self.tile_size = max(self.MIN_TILE_SIZE, tile_size + tile_size % 2) if tile_size > 0 else 0
+        
+        # Rotation is either part of rasterization or a resampling stage;
+        # a resampling stage needs the whole page, so tiles always rasterize it
+        self.max_rotation = options.get('max_rotation', 1.5)
+        self.render_rotation = options.get('rotate', True) and (
+            options.get('render_rotation', False) or bool(self.tile_size))
+        
+        self.stages = []
+        if options.get('rotate', True) and not self.render_rotation:
+            self.stages.append(("rotate", self._rotate))
+        if self.bw:
+            self.bw_table = PDFScannerEffects.threshold_table()
+            # About a fifth of an inch, so a window spans a few lines of text
+            self.bw_window = max(15, self.dpi // 5) | 1
+            self.stages.append(("bw", self._black_and_white))
+        if options.get('add_noise', True):
+            self.stages.append(("noise", self._noise))
+        if self.fold_count:
+            self.stages.append(("fold_marks", self._fold_marks))
+        if options.get('add_shadow', True):
+            self.stages.append(("shadow", self._shadow))
+        if self.blur > 0:
+            self.stages.append(("blur", self._blur))
+        
+        # Pure black and white output can be kept as a 1-bit image
+        self.one_bit = self.bw and self.stages[-1][0] == "bw"
+        
+        # Tiles overlap by this much so the blur and adaptive thresholds see real neighbours at seams
+        self.margin = 2 * int(np.ceil((3 * self.blur + 1) / 2)) if self.blur > 0 else 0
+        if self.bw and self.bw_mode != "global":
+            self.margin += self.bw_window // 2 + self.bw_window // 2 % 2
+    
+    def _rotate(self, img, rng, region):
+        return PDFScannerEffects.add_rotation(img, max_angle=self.max_rotation, rng=rng)
+    
+    def _black_and_white(self, img, rng, region):
+        if self.bw_mode == "global":
+            return img.point(self.bw_table, "1" if self.one_bit else "L")
+        white = PDFScannerEffects.adaptive_threshold(img, self.bw_mode, self.bw_window)
+        return Image.fromarray(white if self.one_bit else white.astype(np.uint8) * 255)
+    
+    def _noise(self, img, rng, region):
+        return PDFScannerEffects.add_noise(img, rng=rng)
+    
+    def _fold_marks(self, img, rng, region):
+        if region is None:
+            return PDFScannerEffects.add_fold_marks(img, count=self.fold_count, rng=rng)
+        return PDFScannerEffects.draw_fold_marks(img, region.folds, offset=region.offset)
+    
+    def _shadow(self, img, rng, region):
+        if region is None:
+            return PDFScannerEffects.add_edge_shadow(img)
+        return PDFScannerEffects.add_edge_shadow(img, (region.width, region.height), region.offset)
+    
+    def _blur(self, img, rng, region):
+        return PDFScannerEffects.apply_blur(img, radius=self.blur)
+    
+    def _render_angle(self, rng):
+        if not self.render_rotation:
+            return 0
+        return rng.uniform(-self.max_rotation, self.max_rotation)
+    
+    def _stage(self, name, page_num):
+        if self.cancel is not None:
+            self.cancel.check()
+        if self.hooks is None:
+            return nullcontext()
+        return self.hooks.stage(name, page_num)
+    
+    def render(self, page, rng=None):
+        """Rasterize a page in the mode the pipeline works in"""
+        if rng is None:
+            rng = np.random.default_rng()
+        angle = self._render_angle(rng)
+        with self._stage("render", page.number):
+            return PDFScannerEffects.convert_page_to_image(page, dpi=self.dpi, mode=self.mode, angle=angle)
+    
+    def apply(self, img, rng=None, region=None, page_num=None):
+        """Run the effect stages on an image, or on a tile placed by region"""
+        if rng is None:
+            rng = np.random.default_rng()
+        if img.mode != self.mode:
+            img = img.convert(self.mode)
+        for name, stage in self.stages:
+            with self._stage(name, page_num):
+                img = stage(img, rng, region)
+        return img
+    
+    def encode(self, img, left=0, top=0, page_num=None, budget=None):
+        """Encode a processed image: CCITT G4 when 1-bit, else JPEG in its own mode
+        
+        With a budget in bytes the JPEG quality is the highest one up to
+        options['quality'] whose output fits, found by bisection over
+        in-memory encodes, or MIN_QUALITY if none does.
+        """
+        with self._stage("encode", page_num):
+            if img.mode == "1":
+                return EncodedTile(left, top, img.width, img.height, PDFScannerEffects.encode_group4(img), img.mode)
+            data = self._jpeg(img, self.quality)
+            if budget is not None and len(data) > budget:
+                # When nothing fits, the last encode tried is the one at MIN_QUALITY
+                low, high, fitting = self.MIN_QUALITY, self.quality - 1, None
+                while low <= high:
+                    quality = (low + high) // 2
+                    data = self._jpeg(img, quality)
+                    if len(data) <= budget:
+                        fitting, low = data, quality + 1
+                    else:
+                        high = quality - 1
+                data = fitting or data
+            return EncodedTile(left, top, img.width, img.height, data, img.mode)
+    
+    @staticmethod
+    def _jpeg(img, quality):
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format="JPEG", quality=quality)
+        return img_bytes.getvalue()
+    
+    def page_budget(self, page):
+        """Bytes the images of a page may take under options['target_size'], or None"""
+        if not self.target_size:
+            return None
+        if self.target_per == "page":
+            return self.target_size
+        return (self.target_size - self.DOCUMENT_OVERHEAD) / len(page.parent)
+    
+    def image_budget(self, page_budget, area, page_area):
+        """Share of a page budget for an image covering area of page_area pixels"""
+        if page_budget is None:
+            return None
+        return max(0, page_budget * area / page_area - self.IMAGE_OVERHEAD)
+    
+    def page_rng(self, page_num, digest=None):
+        """Random generator for one page of the document with the given digest
+        
+        When seeded it depends only on the seed, the page index and the
+        document, so output does not depend on which worker or in which
+        order pages run, while pages of different documents still differ.
+        """
+        if self.seed is None:
+            return np.random.default_rng()
+        entropy = [self.seed, page_num]
+        if digest is not None:
+            entropy.append(int(digest, 16))
+        return np.random.default_rng(entropy)
+    
+    def process_page(self, page, digest=None):
+        """Render one page of the document with the given digest, apply the scanning effects and encode it"""
+        rng = self.page_rng(page.number, digest)
+        if self.tile_size:
+            encoded = self.process_page_tiled(page, rng)
+        else:
+            img = self.apply(self.render(page, rng), rng, page_num=page.number)
+            budget = self.image_budget(self.page_budget(page), 1, 1)
+            encoded = EncodedPage(img.width, img.height, [self.encode(img, page_num=page.number, budget=budget)])
+        if self.hooks is not None:
+            encoded = encoded._replace(profile=self.hooks.take(page.number))
+        return encoded
+    
+    def plan_page(self, page, rng):
+        """Pixel size of a page and the draws its tiles share: render angle and fold marks"""
+        width, height = PDFScannerEffects.page_pixel_size(page, self.dpi)
+        angle = self._render_angle(rng)
+        folds = PDFScannerEffects.plan_fold_marks(width, height, self.fold_count, rng)
+        return PagePlan(width, height, angle, folds)
+    
+    def process_tile(self, page, plan, box, rng, page_num=None):
+        """Render and process the region box = (left, top, right, bottom) of a page
+        
+        page may be a fitz.DisplayList. The region is grown by the overlap
+        margin for rendering and the effects, which see its position on the
+        page, and cropped back afterwards.
+        """
+        margin = self.margin
+        grown = (max(0, box[0] - margin), max(0, box[1] - margin),
+                 min(plan.width, box[2] + margin), min(plan.height, box[3] + margin))
+        with self._stage("render", page_num):
+            img = PDFScannerEffects.convert_page_to_image(page, self.dpi, self.mode, plan.angle, box=grown)
+        img = self.apply(img, rng, PageRegion(plan.width, plan.height, grown[:2], plan.folds), page_num)
+        return img.crop((box[0] - grown[0], box[1] - grown[1], box[2] - grown[0], box[3] - grown[1]))
+    
+    def process_page_tiled(self, page, rng):
+        """Render, process and encode a page one tile at a time
+        
+        Tiles are rendered from the page's display list with a clip and
+        run through the effects one by one. Fold marks and the edge shadow
+        are placed in page coordinates, so they cross the seams.
+        """
+        plan = self.plan_page(page, rng)
+        display_list = page.get_displaylist()
+        page_budget = self.page_budget(page)
+        size = self.tile_size
+        tiles = []
+        
+        for top in range(0, plan.height, size):
+            for left in range(0, plan.width, size):
+                box = (left, top, min(left + size, plan.width), min(top + size, plan.height))
+                img = self.process_tile(display_list, plan, box, rng, page.number)
+                budget = self.image_budget(page_budget, img.width * img.height, plan.width * plan.height)
+                tiles.append(self.encode(img, left, top, page.number, budget))
         
+        return EncodedPage(plan.width, plan.height, tiles)
+
+class StageProfiler:
+    """Pipeline hooks recording wall time and peak memory of every stage
+    
+    Hooks are any object with stage(name, page_num, document=None), a
+    context manager wrapped around each stage of a page, and take(page_num),
+    which returns what was recorded for a finished page so it can travel
+    back from a worker process on its EncodedPage. The stages are render,
+    each effect, encode, plus cache and assemble in the main process.
+    
+    Peak memory is what tracemalloc sees allocated during the stage (Python
+    and NumPy buffers) and the process peak RSS once it ends; Pillow and
+    MuPDF bitmaps only show up in the latter.
+    """
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = []
+    
+    @contextmanager
+    def stage(self, name, page_num, document=None):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
         try:
-            # Get current options
-            options = {
-                'rotate': self.rotate.get(),
-                'max_rotation': self.max_rotation.get(),
-                'grayscale': self.grayscale.get(),
-                'bw': self.bw.get(),
-                'add_noise': self.add_noise.get(),
-                'fold_marks': self.fold_marks.get(),
-                'fold_count': self.fold_count.get(),
-                'add_shadow': self.add_shadow.get(),
-                'blur': self.blur.get()
-            }
-            
-            # Apply effects to the original image
-            img = self.original_image.copy()
-            
-            if options.get('rotate', True):
-                img = PDFScannerEffects.add_rotation(img, max_angle=options.get('max_rotation', 1.5))
-            
-            if options.get('grayscale', True):
-                img = PDFScannerEffects.convert_to_grayscale(img)
-            
-            if options.get('bw', False):
-                img = PDFScannerEffects.convert_to_black_and_white(img)
-            
-            if options.get('add_noise', True):
-                img = PDFScannerEffects.add_noise(img)
-            
-            if options.get('fold_marks', True):
-                img = PDFScannerEffects.add_fold_marks(img, count=options.get('fold_count', 1))
-            
-            if options.get('add_shadow', True):
-                img = PDFScannerEffects.add_edge_shadow(img)
-            
-            if options.get('blur', 0.5) > 0:
-                img = PDFScannerEffects.apply_blur(img, radius=options.get('blur', 0.5))
-            
-            # Update preview with effects
-            self.preview_image = ImageTk.PhotoImage(img)
-            self.preview_canvas.delete("all")
-            self.preview_canvas.create_image(0, 0, anchor="nw", image=self.preview_image)
-            self.preview_canvas.configure(scrollregion=self.preview_canvas.bbox("all"))
-            
-            self.effects_applied = True
-            self.page_label.config(text=f"Page {self.current_page + 1} of {self.total_pages} (with effects)")
-            
-        except Exception as e:
-            messagebox.showerror("Preview Error", f"Could not apply effects: {str(e)}")
-    
-    def prev_page(self):
-        """Go to previous page"""
-        if self.current_page > 0:
-            self.current_page -= 1
-            self.effects_applied = False
-            self.update_preview(force_original=True)
-    
-    def next_page(self):
-        """Go to next page"""
-        if self.current_page < self.total_pages - 1:
-            self.current_page += 1
-            self.effects_applied = False
-            self.update_preview(force_original=True)
-    
-    def browse_input(self):
-        filename = filedialog.askopenfilename(
-            title="Select input PDF file",
-            filetypes=(("PDF files", "*.pdf"), ("All files", "*.*"))
-        )
-        if filename:
-            self.input_pdf.set(filename)
-            # Suggest output filename
-            base, ext = os.path.splitext(filename)
-            self.output_pdf.set(f"{base}_scanned{ext}")
-            # Load preview
-            self.load_pdf_preview(filename)
-    
-    def browse_output(self):
-        filename = filedialog.asksaveasfilename(
-            title="Save scanned PDF as",
-            defaultextension=".pdf",
-            filetypes=(("PDF files", "*.pdf"), ("All files", "*.*"))
-        )
-        if filename:
-            self.output_pdf.set(filename)
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - base
+            self.records.append({
+                "document": document,
+                "page": page_num,
+                "stage": name,
+                "seconds": seconds,
+                "peak_bytes": max(0, peak),
+                "max_rss_bytes": self.max_rss(),
+            })
     
-    def process_pdf_threaded(self):
-        if not self.input_pdf.get():
-            messagebox.showerror("Error", "Please select an input PDF file")
-            return
+    def take(self, page_num):
+        """Remove and return the pipeline records of one page"""
+        taken, kept = [], []
+        for record in self.records:
+            mine = record["page"] == page_num and record["document"] is None
+            (taken if mine else kept).append(record)
+        self.records = kept
+        return taken
+    
+    def merge(self, records, document=None):
+        """Add records taken elsewhere, e.g. in a worker, for a document"""
+        for record in records:
+            self.records.append(dict(record, document=document))
+    
+    @staticmethod
+    def max_rss(children=False):
+        """Peak RSS in bytes of this process, or of its largest finished child"""
+        if resource is None:
+            return None
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        scale = 1 if os.uname().sysname == "Darwin" else 1024
+        who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+        return resource.getrusage(who).ru_maxrss * scale
+    
+    def report(self):
+        """Aggregate the records per stage and per page"""
+        stages, pages = {}, {}
+        for record in self.records:
+            total = stages.setdefault(record["stage"], {
+                "calls": 0, "seconds": 0.0, "max_seconds": 0.0, "peak_bytes": 0, "max_rss_bytes": None})
+            total["calls"] += 1
+            total["seconds"] += record["seconds"]
+            total["max_seconds"] = max(total["max_seconds"], record["seconds"])
+            total["peak_bytes"] = max(total["peak_bytes"], record["peak_bytes"])
+            if record["max_rss_bytes"] is not None:
+                total["max_rss_bytes"] = max(total["max_rss_bytes"] or 0, record["max_rss_bytes"])
+            if record["page"] is not None:
+                page = pages.setdefault((record["document"], record["page"]), {
+                    "document": record["document"], "page": record["page"], "seconds": {}, "peak_bytes": 0})
+                page["seconds"][record["stage"]] = page["seconds"].get(record["stage"], 0.0) + record["seconds"]
+                page["peak_bytes"] = max(page["peak_bytes"], record["peak_bytes"])
         
-        if not self.output_pdf.get():
-            messagebox.showerror("Error", "Please specify an output PDF file")
-            return
+        busy = sum(total["seconds"] for total in stages.values())
+        for total in stages.values():
+            total["mean_seconds"] = total["seconds"] / total["calls"]
+            total["share"] = total["seconds"] / busy if busy else 0.0
+        return {
+            "wall_seconds": time.perf_counter() - self.started,
+            "pages": len(pages),
+            "stages": stages,
+            "page_details": list(pages.values()),
+        }
+    
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+class PageCache:
+    """On-disk cache of encoded pages with a size cap and LRU eviction
+    
+    Entries are keyed by a digest of the page content and of the options
+    that change how a page looks, so re-running a document with the same
+    settings only reads files. A hit refreshes the entry's mtime, which
+    gives the least recently used order for eviction. It is enabled with
+    options['cache_dir'], and iter_pages does not render the pages it hits.
+    """
+    
+    # Options that change the encoded result of a page
+    KEY_OPTIONS = ('dpi', 'rotate', 'max_rotation', 'render_rotation', 'grayscale', 'bw', 'bw_mode',
+                   'add_noise', 'fold_marks', 'fold_count', 'add_shadow', 'blur', 'quality',
+                   'tile_size', 'seed', 'target_size', 'target_per')
+    
+    # References from a page or its annotations to other pages
+    PAGE_LINKS = re.compile(r"/(?:Parent|P|Dest|D)\s*(?:\d+\s+0\s+R|\[[^\]]*\])")
+    
+    def __init__(self, directory, max_bytes=1024 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in self._entries())
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+    
+    @staticmethod
+    def from_options(options):
+        """Cache configured by options['cache_dir'] and options['cache_size'] (MB), or None"""
+        if not options.get('cache_dir'):
+            return None
+        return PageCache(options['cache_dir'], options.get('cache_size', 1024) * 2**20)
+    
+    @staticmethod
+    def page_digest(doc, page_num):
+        """Digest of a page's geometry and of every object it draws from"""
+        page = doc[page_num]
+        digest = hashlib.sha256(repr((tuple(page.rect), page.rotation)).encode())
+        
+        # Resources may be inherited from the page tree
+        owner = page.xref
+        while doc.xref_get_key(owner, "Resources")[0] == "null":
+            kind, parent = doc.xref_get_key(owner, "Parent")
+            if kind != "xref":
+                break
+            owner = int(parent.split()[0])
+        resources = doc.xref_get_key(owner, "Resources")[1]
+        digest.update(resources.encode())
         
-        threading.Thread(target=self.process_pdf).start()
+        # Links to other pages (the page's /Parent, annotation /P, link /Dest
+        # and /D) would pull in the whole page tree
+        source = PageCache.PAGE_LINKS.sub("", doc.xref_object(page.xref, compressed=True))
+        todo = [int(xref) for xref in re.findall(r"(\d+)\s+0\s+R", source + resources)]
+        digest.update(source.encode())
+        seen = {page.xref}
+        while todo:
+            xref = todo.pop()
+            if xref in seen:
+                continue
+            seen.add(xref)
+            source = doc.xref_object(xref, compressed=True)
+            if re.search(r"/Type\s*/Pages?\b", source):
+                continue
+            source = PageCache.PAGE_LINKS.sub("", source)
+            digest.update(b"%d:" % xref + source.encode())
+            if doc.xref_is_stream(xref):
+                digest.update(doc.xref_stream_raw(xref))
+            todo.extend(int(ref) for ref in re.findall(r"(\d+)\s+0\s+R", source))
+        return digest.hexdigest()
+    
+    @staticmethod
+    def key(doc, page_num, options, digest=None):
+        """Cache key of a page of the document with the given digest processed with options"""
+        settings = json.dumps({name: options.get(name) for name in PageCache.KEY_OPTIONS}, sort_keys=True)
+        content = PageCache.page_digest(doc, page_num)
+        if options.get('seed') is not None:
+            # Seeded pages draw from a generator tied to their index and document
+            content += f":{page_num}:{digest}"
+        if options.get('target_size') and options.get('target_per', "document") != "page":
+            # A document size target is shared between its pages
+            content += f"/{len(doc)}"
+        return hashlib.sha256(f"{content}:{settings}".encode()).hexdigest()
     
-    def process_pdf(self):
-        self.status_var.set("Processing...")
-        self.progress['value'] = 0
-        self.root.update_idletasks()
+    @staticmethod
+    def write_page(fileobj, page):
+        """Serialize an EncodedPage: a JSON header line followed by the tile data"""
+        header = {
+            "width": page.width,
+            "height": page.height,
+            "tiles": [[tile.left, tile.top, tile.width, tile.height, tile.mode, len(tile.data)]
+                      for tile in page.tiles],
+        }
+        fileobj.write(json.dumps(header).encode() + b"\n")
+        for tile in page.tiles:
+            fileobj.write(tile.data)
+    
+    @staticmethod
+    def read_page(fileobj):
+        """Read an EncodedPage written by write_page"""
+        header = json.loads(fileobj.readline())
+        tiles = [EncodedTile(left, top, width, height, fileobj.read(size), mode)
+                 for left, top, width, height, mode, size in header["tiles"]]
+        return EncodedPage(header["width"], header["height"], tiles)
+    
+    def _entries(self):
+        return [entry for entry in os.scandir(self.directory)
+                if entry.is_file() and entry.name.endswith(".page")]
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".page")
+    
+    def get(self, key):
+        """Cached EncodedPage for key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                page = PageCache.read_page(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            # A damaged entry is just a miss; it is rewritten on put
+            return None
+        return page
+    
+    def put(self, key, page):
+        """Store an EncodedPage, then evict old entries beyond the size cap
         
+        Failing to write is not an error: the page is just not cached.
+        """
+        import tempfile
+        path = self._path(key)
+        # A unique temp file, as threads of one process may store the same page at once
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
         try:
-            options = {
-                'dpi': self.dpi.get(),
-                'rotate': self.rotate.get(),
-                'max_rotation': self.max_rotation.get(),
-                'grayscale': self.grayscale.get(),
-                'bw': self.bw.get(),
-                'add_noise': self.add_noise.get(),
-                'fold_marks': self.fold_marks.get(),
-                'fold_count': self.fold_count.get(),
-                'quality': self.quality.get(),
-                'scanner_name': self.scanner_name.get(),
-                'add_shadow': self.add_shadow.get(),
-                'blur': self.blur.get()
-            }
-            
-            PDFScannerEffects.process_pdf(self.input_pdf.get(), self.output_pdf.get(), options)
-            
-            self.status_var.set("Completed!")
-            self.progress['value'] = 100
-            messagebox.showinfo("Success", f"Created scanned-looking PDF: {self.output_pdf.get()}")
-            
-        except Exception as e:
-            self.status_var.set(f"Error: {str(e)}")
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            with os.fdopen(fd, "wb") as f:
+                PageCache.write_page(f, page)
+            if os.path.exists(path):
+                self.total_bytes -= os.path.getsize(path)
+            self.total_bytes += os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        self.total_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self.total_bytes -= size
+
+class CheckpointJournal:
+    """Work directory recording every finished page of one process_pdf run
+    
+    Each page is written to its own file as soon as it is done, next to a
+    manifest naming the input, the options and the document metadata. A
+    run that is killed can be resumed with the same directory: pages in
+    the journal are read back instead of being processed again, and the
+    final PDF is assembled from both. The journal is removed once the
+    output is complete. It is kept with options['checkpoint_dir'] and
+    belongs to a single document, so iter_pages takes it only for one source.
+    """
+    MANIFEST = "journal.json"
+    
+    def __init__(self, directory):
+        self.directory = directory
+        self.done = set()
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, page_num):
+        return os.path.join(self.directory, f"page-{page_num:06d}.page")
+    
+    def _write(self, path, write):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            write(f)
+            f.flush()
+            # A page in the journal must survive the process being killed right after
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    
+    def start(self, digest, options, page_count, metadata, resume=False):
+        """Begin a run on the input with the given digest, or continue the recorded one if resume is set
+        
+        Returns the document metadata to use, which is the recorded one
+        when resuming. Resuming a journal made for another input or other
+        options raises ValueError; with nothing recorded yet the run just
+        starts from the first page.
+        """
+        manifest = {
+            "input": digest,
+            "options": {name: options.get(name) for name in PageCache.KEY_OPTIONS + ('scanner_name',)},
+            "page_count": page_count,
+        }
+        path = os.path.join(self.directory, self.MANIFEST)
+        if resume and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                recorded = json.load(f)
+            if any(recorded[name] != value for name, value in manifest.items()):
+                raise ValueError(f"Checkpoint in {self.directory} is for another input or other options")
+            self.done = {page_num for page_num in range(page_count) if os.path.exists(self._path(page_num))}
+            return recorded["metadata"]
+        
+        self.clear()
+        manifest["metadata"] = metadata
+        self._write(path, lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+        return metadata
+    
+    def get(self, page_num):
+        """Recorded EncodedPage of page_num, or None"""
+        if page_num not in self.done:
+            return None
+        try:
+            with open(self._path(page_num), "rb") as f:
+                return PageCache.read_page(f)
+        except (OSError, ValueError, KeyError, TypeError):
+            # Damaged or missing: the page is simply processed again
+            self.done.discard(page_num)
+            return None
+    
+    def record(self, page_num, page):
+        """Write a finished page to the journal, unless it came from there"""
+        if page_num not in self.done:
+            self._write(self._path(page_num), lambda f: PageCache.write_page(f, page))
+            self.done.add(page_num)
+    
+    def clear(self):
+        """Remove the recorded pages and manifest"""
+        for entry in os.scandir(self.directory):
+            if entry.name == self.MANIFEST or entry.name.endswith((".page", ".tmp")):
+                os.remove(entry.path)
+        self.done = set()
+
+class DocumentPDFWriter:
+    """Collects pages in one in-memory fitz document, written out on close"""
+    
+    def __init__(self, output_pdf, deterministic=False):
+        self.output_pdf = output_pdf
+        self.deterministic = deterministic
+        self.doc = fitz.open()
+        self.page_count = 0
+    
+    def add_page(self, page):
+        """Insert the tiles of an EncodedPage as a new page"""
+        new_page = self.doc.new_page(width=page.width, height=page.height)
+        for tile in page.tiles:
+            rect = fitz.Rect(tile.left, tile.top, tile.left + tile.width, tile.top + tile.height)
+            if tile.mode == "1":
+                new_page.insert_image(rect, xref=self._group4_image(tile))
+            else:
+                new_page.insert_image(rect, stream=tile.data)
+        self.page_count += 1
+    
+    def _group4_image(self, tile):
+        """Add a 1-bit tile as an image object with its G4 data kept as it is"""
+        xref = self.doc.get_new_xref()
+        self.doc.update_object(xref, "<<>>")
+        # update_stream drops any filter, so the image dictionary is set after it
+        self.doc.update_stream(xref, tile.data, compress=False)
+        self.doc.update_object(xref, "<< %s >>" % StreamingPDFWriter.image_entries(tile).decode())
+        return xref
+    
+    def close(self, metadata):
+        """Set the metadata and write the document to the output path or file object"""
+        PDFScannerEffects.apply_metadata(self.doc, metadata)
+        # A fresh random /ID would make seeded output differ between runs
+        data = self.doc.tobytes(deflate=True, no_new_id=self.deterministic)
+        self.doc.close()
+        if hasattr(self.output_pdf, 'write'):
+            self.output_pdf.write(data)
+        else:
+            with open(self.output_pdf, "wb") as f:
+                f.write(data)
+    
+    def abort(self):
+        """Drop the collected pages without writing anything"""
+        self.doc.close()
+
+class StreamingPDFWriter:
+    """Minimal PDF writer that emits each page as soon as it is added
+    
+    Only the byte offsets of the written objects are kept, so documents of
+    any length are written with constant memory, and the target can be a
+    non-seekable stream such as stdout. Given a path instead, it writes to
+    <path>.tmp, which becomes path on close and is removed on abort, so a
+    failed run leaves no truncated PDF behind.
+    """
+    # Color space, bits per component and filter of the tile data for each image mode
+    IMAGE_FORMATS = {
+        "RGB": (b"/DeviceRGB", 8, b"/DCTDecode"),
+        "L": (b"/DeviceGray", 8, b"/DCTDecode"),
+        "1": (b"/DeviceGray", 1, b"/CCITTFaxDecode"),
+    }
+    
+    # Objects 1 and 2 are reserved for the catalog and the page tree
+    CATALOG, PAGES = 1, 2
+    
+    def __init__(self, fileobj=None, path=None):
+        self.path = path
+        self.fileobj = open(path + ".tmp", "wb") if path is not None else fileobj
+        self.position = 0
+        self.offsets = {}
+        self.next_object = 3
+        self.page_objects = []
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.position += len(data)
+    
+    def _write_object(self, entries, stream=None, number=None):
+        """Write a dictionary object, optionally with a stream, and return its number"""
+        if number is None:
+            number = self.next_object
+            self.next_object += 1
+        self.offsets[number] = self.position
+        
+        if stream is None:
+            self._write(b"%d 0 obj\n<< %s >>\nendobj\n" % (number, entries))
+        else:
+            self._write(b"%d 0 obj\n<< %s /Length %d >>\nstream\n" % (number, entries, len(stream)))
+            self._write(stream)
+            self._write(b"\nendstream\nendobj\n")
+        return number
+    
+    @property
+    def page_count(self):
+        return len(self.page_objects)
+    
+    @staticmethod
+    def image_entries(tile):
+        """Image dictionary entries, without /Length, for an EncodedTile"""
+        colorspace, bits, image_filter = StreamingPDFWriter.IMAGE_FORMATS[tile.mode]
+        entries = (b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+                   b"/BitsPerComponent %d /Filter %s" % (tile.width, tile.height, colorspace, bits, image_filter))
+        if tile.mode == "1":
+            # Group 4 with black pixels coded as 1 bits, as libtiff writes it
+            entries += b" /DecodeParms << /K -1 /Columns %d /Rows %d /BlackIs1 true >>" % (tile.width, tile.height)
+        return entries
+    
+    def add_page(self, page):
+        """Write an EncodedPage made of JPEG or G4 tiles"""
+        images, drawing = [], []
+        for index, tile in enumerate(page.tiles):
+            images.append(b"/Im%d %d 0 R" % (index, self._write_object(self.image_entries(tile), stream=tile.data)))
+            # PDF space has its origin at the bottom left
+            bottom = page.height - tile.top - tile.height
+            drawing.append(b"q %d 0 0 %d %d %d cm /Im%d Do Q" % (tile.width, tile.height, tile.left, bottom, index))
+        
+        content = self._write_object(b"", stream=b"\n".join(drawing))
+        self.page_objects.append(self._write_object(
+            b"/Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /XObject << %s >> >> /Contents %d 0 R"
+            % (self.PAGES, page.width, page.height, b" ".join(images), content)
+        ))
+        self.fileobj.flush()
+    
+    def close(self, metadata):
+        """Write the page tree, document info and cross-reference table"""
+        kids = b" ".join(b"%d 0 R" % number for number in self.page_objects)
+        self._write_object(b"/Type /Pages /Kids [%s] /Count %d" % (kids, len(self.page_objects)), number=self.PAGES)
+        self._write_object(b"/Type /Catalog /Pages %d 0 R" % self.PAGES, number=self.CATALOG)
+        info = self._write_object(b" ".join(
+            b"/%s %s" % (key.lstrip("/").encode(), fitz.get_pdf_str(value).encode())
+            for key, value in metadata.items()
+        ))
+        
+        xref_offset = self.position
+        size = self.next_object
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for number in range(1, size):
+            self._write(b"%010d 00000 n \n" % self.offsets[number])
+        self._write(b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                    % (size, self.CATALOG, info, xref_offset))
+        self.fileobj.flush()
+        if self.path is not None:
+            self.fileobj.close()
+            os.replace(self.path + ".tmp", self.path)
+    
+    def abort(self):
+        """Stop writing; a path output is removed, a stream keeps what was written"""
+        if self.path is not None:
+            self.fileobj.close()
+            os.remove(self.path + ".tmp")
+
+# Per-process state of the page pool used by iter_pages
+_worker = None
+
+def _init_page_worker(options, documents):
+    global _worker
+    _worker = PageWorker(options, documents)
+
+def _process_page_worker(name, page_num, digest):
+    return _worker.process(name, page_num, digest)
+
+# Per-process PageWorkers of a WarmPagePool, by options
+_warm_workers = OrderedDict()
+
+def _warm_up_worker():
+    with fitz.open() as doc:
+        ScanPipeline({'dpi': 36}).process_page(doc.new_page())
+
+def _process_warm_page(options, name, page_num, digest):
+    key = json.dumps(options, sort_keys=True)
+    worker = _warm_workers.pop(key, None)
+    if worker is None:
+        worker = PageWorker(options)
+        if len(_warm_workers) >= WarmPagePool.MAX_PIPELINES:
+            _warm_workers.popitem(last=False)[1].close()
+    _warm_workers[key] = worker
+    return worker.process(name, page_num, digest)
+
+def parse_size(text):
+    """Byte count from a size such as 800000, 500K, 2M or 1.5MB"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*", text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {text!r}")
+    return int(float(match.group(1)) * 1024 ** " KMG".index(match.group(2).upper() or " "))
+
+def parse_seed(text):
+    """Seed from text, which must be a non-negative integer"""
+    seed = int(text)
+    if seed < 0:
+        raise ValueError(f"Seed must be non-negative: {text!r}")
+    return seed
+
+def parse_tile_size(text):
+    """Tile size from text: 0 for whole pages, or at least ScanPipeline.MIN_TILE_SIZE pixels"""
+    tile_size = int(text)
+    if tile_size != 0 and tile_size < ScanPipeline.MIN_TILE_SIZE:
+        raise ValueError(f"Tile size must be 0 or at least {ScanPipeline.MIN_TILE_SIZE}: {text!r}")
+    return tile_size
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Convert a PDF to look like it's been scanned")
-    parser.add_argument("input_pdf", help="Path to the input PDF file")
-    parser.add_argument("output_pdf", help="Path to save the scanned-looking PDF")
+    parser.add_argument("input_pdf", nargs="?", help="Path to the input PDF file ('-' for stdin)")
+    parser.add_argument("output_pdf", nargs="?", help="Path to save the scanned-looking PDF ('-' for stdout)")
+    parser.add_argument("--batch", help="Process a directory, a glob pattern or a manifest file of PDFs on one shared pool")
+    parser.add_argument("--output-dir", help="Output directory for --batch (default: next to each input)")
+    parser.add_argument("--summary", help="Write the per-file --batch summary to this JSON file")
+    parser.add_argument("--serve", metavar="ADDRESS", help="Run as a local scanning service on host:port or unix:/path/to/socket")
+    parser.add_argument("--max-queued", type=int, default=16, help="Requests --serve keeps waiting for a worker before answering 503")
     parser.add_argument("--dpi", type=int, default=150, help="DPI for the scanned effect")
     parser.add_argument("--rotate", action="store_true", help="Add slight random rotation")
     parser.add_argument("--max-rotation", type=float, default=1.5, help="Maximum rotation angle in degrees")
+    parser.add_argument("--render-rotation", action="store_true", help="Rotate while rasterizing (white corners, page size kept)")
     parser.add_argument("--grayscale", action="store_true", help="Convert to grayscale")
     parser.add_argument("--bw", action="store_true", help="Convert to black and white")
+    parser.add_argument("--bw-mode", choices=["global", "sauvola", "niblack"], default="global",
+                        help="Black and white thresholding: one global threshold or adaptive per pixel (implies --bw)")
     parser.add_argument("--add-noise", action="store_true", help="Add noise to simulate scanner artifacts")
     parser.add_argument("--fold-marks", action="store_true", help="Add fold marks to pages")
     parser.add_argument("--fold-count", type=int, default=1, help="Number of fold marks to add")
     parser.add_argument("--quality", type=int, default=85, help="JPEG quality for compression artifacts")
+    parser.add_argument("--target-size", type=parse_size, help="Lower JPEG quality page by page to fit this size, e.g. 2M or 500K")
+    parser.add_argument("--target-per", choices=["document", "page"], default="document",
+                        help="Whether --target-size is for the whole document or for every page")
     parser.add_argument("--scanner-name", default="HP ScanJet Pro 3000", help="Scanner name for metadata")
     parser.add_argument("--add-shadow", action="store_true", help="Add subtle shadow near edges")
     parser.add_argument("--blur", type=float, default=0, help="Apply slight blur (0-2.0)")
-    return parser.parse_args()
+    parser.add_argument("--seed", type=parse_seed, help="Seed for reproducible effects (non-negative integer)")
+    parser.add_argument("--jobs", dest="workers", type=int, help="Number of worker processes (0 = one per CPU core; default 1, or 0 with --serve)")
+    parser.add_argument("--stream", action="store_true", help="Write pages to the output as they finish to bound memory use")
+    parser.add_argument("--max-resident-pages", type=int, default=4, help="Pages kept in memory at once in streaming mode")
+    parser.add_argument("--cache-dir", help="Directory of the page result cache used to skip unchanged pages on re-runs")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Page cache size limit in MB")
+    parser.add_argument("--tile-size", type=parse_tile_size, default=0, help="Process pages in tiles of at least 64 pixels to cap memory (0 = whole pages)")
+    parser.add_argument("--checkpoint-dir", help="Keep every finished page in this work directory so an interrupted run can be resumed")
+    parser.add_argument("--resume", action="store_true", help="Continue the interrupted run recorded in --checkpoint-dir")
+    parser.add_argument("--profile", help="Write time and memory used by each stage of each page to this JSON file")
+    args = parser.parse_args()
+    if args.batch is None and args.serve is None and (args.input_pdf is None or args.output_pdf is None):
+        parser.error("input_pdf and output_pdf are required unless --batch or --serve is given")
+    if args.workers is None:
+        args.workers = 0 if args.serve is not None else 1
+    if args.resume and not args.checkpoint_dir:
+        parser.error("--resume needs --checkpoint-dir")
+    if args.checkpoint_dir and (args.batch is not None or args.serve is not None):
+        parser.error("--checkpoint-dir is for single documents, not --batch or --serve")
+    return args
 
 if __name__ == "__main__":
     import sys
@@ -572,10 +1717,40 @@ if __name__ == "__main__":
         # Command line mode
         args = parse_args()
         options = vars(args)
-        PDFScannerEffects.process_pdf(args.input_pdf, args.output_pdf, options)
-        print(f"Created scanned-looking PDF: {args.output_pdf}")
+        if args.serve is not None:
+            from scanner_service import run_service
+            run_service(args.serve, options, args.max_queued)
+            sys.exit(0)
+        if args.profile:
+            options['hooks'] = StageProfiler()
+        if args.batch is not None:
+            jobs = PDFScannerEffects.collect_batch_jobs(args.batch, args.output_dir)
+            summaries = PDFScannerEffects.process_batch(jobs, options)
+            for summary in summaries:
+                if summary["status"] == "ok":
+                    print(f"ok     {summary['pages']:5d} pages  {summary['output']}")
+                else:
+                    print(f"{summary['status']:6} {summary['pages']:5d} pages  {summary['input']}: {summary.get('error', '')}")
+            failed = sum(summary["status"] != "ok" for summary in summaries)
+            print(f"Processed {len(summaries) - failed} of {len(summaries)} PDFs")
+            if args.summary:
+                with open(args.summary, "w", encoding="utf-8") as f:
+                    json.dump(summaries, f, indent=2)
+            if args.profile:
+                options['hooks'].write(args.profile)
+            sys.exit(1 if failed else 0)
+        input_pdf = sys.stdin.buffer if args.input_pdf == "-" else args.input_pdf
+        output_pdf = sys.stdout.buffer if args.output_pdf == "-" else args.output_pdf
+        PDFScannerEffects.process_pdf(input_pdf, output_pdf, options)
+        if args.profile:
+            options['hooks'].write(args.profile)
+        if args.output_pdf != "-":
+            print(f"Created scanned-looking PDF: {args.output_pdf}")
+            size = os.path.getsize(args.output_pdf)
+            if args.target_size and args.target_per == "document" and size > args.target_size:
+                print(f"Output is {size} bytes, over the {args.target_size} byte target: "
+                      f"some pages do not fit their share even at the lowest JPEG quality")
     else:
         # GUI mode
-        root = tk.Tk()
-        app = ScannerApp(root)
-        root.mainloop()
\ No newline at end of file
+        from scanner_gui import run_gui
+        run_gui()
\ No newline at end of file
@@ -0,0 +1,755 @@
+import os
+import queue
+import random
+import threading
+import numpy as np
+from PIL import Image, ImageTk
+import fitz  # PyMuPDF
+import tkinter as tk
+from tkinter import filedialog, ttk, messagebox
+from collections import OrderedDict
+from main import CancelToken, PDFScannerEffects, ProcessingCancelled, ScanPipeline
+
+# Zoom of the page preview relative to 72 DPI
+PREVIEW_SCALE = 0.75
+
+# Zoomed previews are rendered in square tiles of this many pixels
+TILE_SIZE = 512
+ZOOM_LEVELS = ("Fit", "72 DPI", "150 DPI", "300 DPI", "600 DPI")
+
+class PreviewRenderer:
+    """Renders preview pages and tiles on a background thread into LRU caches
+    
+    The thread owns the fitz document, as documents must not be used from
+    two threads at once. request() and request_tiles() return what is
+    cached immediately; everything else is rendered in the background and
+    handed to on_ready as ("page", page_num, scale, img) or ("tile",
+    page_num, dpi, signature, box, img), with the exception instead of the
+    image if rendering failed. Wanted tiles come first; while idle the
+    thread prefetches the pages around the last requested one.
+    
+    Tiles are rendered through get_pixmap(clip=...) at the zoom DPI and,
+    when effect options are given, run through a ScanPipeline in page
+    coordinates, so effects line up across tiles. Each zoom level has its
+    own tile cache.
+    """
+    
+    def __init__(self, pdf_path, on_ready, capacity=16, prefetch=2, tile_capacity=64):
+        self.doc = fitz.open(pdf_path)
+        self.page_count = len(self.doc)
+        self.page_rects = [page.rect for page in self.doc]
+        self.on_ready = on_ready
+        self.capacity = capacity
+        self.prefetch = prefetch
+        self.tile_capacity = tile_capacity
+        self.cache = OrderedDict()
+        self.tile_caches = {}
+        self.failed = set()
+        self.wanted = None
+        self.wanted_tiles = []
+        self.pipelines = {}
+        self.plans = {}
+        self.closed = False
+        self.condition = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    @staticmethod
+    def signature(options):
+        """Hashable form of effect options; None for the plain page"""
+        return None if options is None else tuple(sorted(options.items()))
+    
+    def pixel_size(self, page_num, dpi):
+        """Size in pixels of a page at the given DPI"""
+        size = (self.page_rects[page_num] * fitz.Matrix(dpi/72, dpi/72)).irect
+        return size.width, size.height
+    
+    def request(self, page_num, scale=PREVIEW_SCALE):
+        """Cached image of a page, or None if it will be delivered to on_ready"""
+        with self.condition:
+            self.wanted = (page_num, scale)
+            self.condition.notify()
+            img = self.cache.get((page_num, scale))
+            if img is not None:
+                self.cache.move_to_end((page_num, scale))
+            return img
+    
+    def request_tiles(self, page_num, dpi, boxes, options=None):
+        """Cached tiles among boxes as {box: img}; the rest are delivered to on_ready
+        
+        Replaces the previously wanted tiles, so tiles scrolled out of view
+        before they were rendered are skipped.
+        """
+        signature = self.signature(options)
+        with self.condition:
+            cache = self.tile_caches.setdefault(dpi, OrderedDict())
+            cached = {}
+            self.wanted_tiles = []
+            for box in boxes:
+                key = (page_num, signature, box)
+                if key in cache:
+                    cache.move_to_end(key)
+                    cached[box] = cache[key]
+                else:
+                    self.wanted_tiles.append((page_num, dpi, signature, box))
+            self.condition.notify()
+            return cached
+    
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+    
+    def _next_job(self):
+        # Wanted tiles first, then the requested page and its neighbours, nearest first
+        while self.wanted_tiles:
+            job = self.wanted_tiles[0]
+            page_num, dpi, signature, box = job
+            if (page_num, signature, box) not in self.tile_caches[dpi] and job not in self.failed:
+                return job
+            self.wanted_tiles.pop(0)
+        if self.wanted is None:
+            return None
+        page_num, scale = self.wanted
+        for distance in range(self.prefetch + 1):
+            for candidate in (page_num + distance, page_num - distance):
+                job = (candidate, scale)
+                if 0 <= candidate < self.page_count and job not in self.cache and job not in self.failed:
+                    return job
+        return None
+    
+    def _render_tile(self, page_num, dpi, signature, box):
+        page = self.doc[page_num]
+        if signature is None:
+            return PDFScannerEffects.convert_page_to_image(page, dpi, box=box)
+        
+        pipeline = self.pipelines.get((dpi, signature))
+        if pipeline is None:
+            if len(self.pipelines) > 8:
+                self.pipelines.clear()
+            options = dict(signature, dpi=dpi, tile_size=TILE_SIZE)
+            pipeline = self.pipelines[(dpi, signature)] = ScanPipeline(options)
+        plan = self.plans.get((page_num, dpi, signature))
+        if plan is None:
+            if len(self.plans) > 64:
+                self.plans.clear()
+            plan = self.plans[(page_num, dpi, signature)] = pipeline.plan_page(page, np.random.default_rng(page_num))
+        rng = np.random.default_rng([page_num, box[0], box[1]])
+        return pipeline.process_tile(page, plan, box, rng, page_num)
+    
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed and self._next_job() is None:
+                    self.condition.wait()
+                if self.closed:
+                    break
+                job = self._next_job()
+            
+            try:
+                if len(job) == 4:
+                    img = self._render_tile(*job)
+                else:
+                    page_num, scale = job
+                    pix = self.doc[page_num].get_pixmap(matrix=fitz.Matrix(scale, scale))
+                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            except Exception as e:
+                with self.condition:
+                    self.failed.add(job)
+                img = e
+            else:
+                with self.condition:
+                    if len(job) == 4:
+                        page_num, dpi, signature, box = job
+                        cache = self.tile_caches[dpi]
+                        cache[(page_num, signature, box)] = img
+                        capacity = self.tile_capacity
+                    else:
+                        cache = self.cache
+                        cache[job] = img
+                        capacity = self.capacity
+                    while len(cache) > capacity:
+                        cache.popitem(last=False)
+            
+            if len(job) == 4:
+                self.on_ready(("tile",) + job + (img,))
+            elif job == self.wanted:
+                self.on_ready(("page",) + job + (img,))
+        self.doc.close()
+
+class ScannerApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("PDF Scanner Effect Creator")
+        self.root.geometry("800x800")
+        
+        self.input_pdf = tk.StringVar()
+        self.output_pdf = tk.StringVar()
+        self.dpi = tk.IntVar(value=150)
+        self.rotate = tk.BooleanVar(value=True)
+        self.max_rotation = tk.DoubleVar(value=1.5)
+        self.grayscale = tk.BooleanVar(value=True)
+        self.bw = tk.BooleanVar(value=False)
+        self.bw_mode = tk.StringVar(value="global")
+        self.add_noise = tk.BooleanVar(value=True)
+        self.fold_marks = tk.BooleanVar(value=True)
+        self.fold_count = tk.IntVar(value=1)
+        self.quality = tk.IntVar(value=85)
+        self.scanner_name = tk.StringVar(value="HP ScanJet Pro 3000")
+        self.add_shadow = tk.BooleanVar(value=True)
+        self.blur = tk.DoubleVar(value=0.5)
+        self.live_preview = tk.BooleanVar(value=True)
+        self.zoom = tk.StringVar(value=ZOOM_LEVELS[0])
+        
+        # Preview variables
+        self.renderer = None
+        self.current_page = 0
+        self.total_pages = 0
+        self.preview_image = None
+        self.original_image = None
+        self.effects_applied = False
+        
+        # Processing runs in a thread and reports back through this queue,
+        # which the Tk thread polls; widgets are only touched from Tk
+        self.events = queue.Queue()
+        self.cancel_token = None
+        self.preview_events = queue.Queue()
+        # Renderer events are tagged with this, so a closed renderer's late results are dropped
+        self.renderer_generation = 0
+        
+        # Live effect preview: debounce timer, latest run and its cancel token
+        self.effect_timer = None
+        self.effect_generation = 0
+        self.effect_cancel = None
+        
+        # Zoomed preview: (page, dpi, signature) shown, its drawn tiles and pending refresh
+        self.tile_view = None
+        self.tile_images = {}
+        self.tile_refresh = None
+        self.zoom_effects = False
+        
+        self.create_widgets()
+        for var in (self.rotate, self.max_rotation, self.grayscale, self.bw, self.bw_mode, self.add_noise, self.fold_marks,
+                    self.fold_count, self.add_shadow, self.blur, self.live_preview):
+            var.trace_add("write", self.schedule_effect_preview)
+        self.root.after(50, self.poll_preview_events)
+    
+    def create_widgets(self):
+        # Main container with paned window
+        main_paned = ttk.PanedWindow(self.root, orient=tk.HORIZONTAL)
+        main_paned.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        # Left frame for controls
+        left_frame = ttk.Frame(main_paned)
+        main_paned.add(left_frame, weight=1)
+        
+        # Right frame for preview
+        right_frame = ttk.LabelFrame(main_paned, text="PDF Preview")
+        main_paned.add(right_frame, weight=1)
+        
+        # File selection frame
+        file_frame = ttk.LabelFrame(left_frame, text="File Selection")
+        file_frame.pack(fill="x", padx=5, pady=5)
+        
+        ttk.Label(file_frame, text="Input PDF:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Entry(file_frame, textvariable=self.input_pdf, width=30).grid(row=0, column=1, padx=5, pady=5)
+        ttk.Button(file_frame, text="Browse...", command=self.browse_input).grid(row=0, column=2, padx=5, pady=5)
+        
+        ttk.Label(file_frame, text="Output PDF:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
+        ttk.Entry(file_frame, textvariable=self.output_pdf, width=30).grid(row=1, column=1, padx=5, pady=5)
+        ttk.Button(file_frame, text="Browse...", command=self.browse_output).grid(row=1, column=2, padx=5, pady=5)
+        
+        # Options frame
+        options_frame = ttk.LabelFrame(left_frame, text="Scanning Effect Options")
+        options_frame.pack(fill="both", expand=True, padx=5, pady=5)
+        
+        # Basic options
+        ttk.Checkbutton(options_frame, text="Add rotation", variable=self.rotate).grid(row=0, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(options_frame, text="Max rotation:").grid(row=0, column=1, sticky=tk.W, padx=5, pady=2)
+        ttk.Scale(options_frame, from_=0.1, to=5.0, variable=self.max_rotation, orient=tk.HORIZONTAL, length=100).grid(row=0, column=2, padx=5, pady=2)
+        
+        ttk.Checkbutton(options_frame, text="Grayscale", variable=self.grayscale).grid(row=1, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Checkbutton(options_frame, text="Black & White", variable=self.bw).grid(row=1, column=1, sticky=tk.W, padx=5, pady=2)
+        self.bw_mode_box = ttk.Combobox(options_frame, textvariable=self.bw_mode, values=("global", "sauvola", "niblack"), state="disabled", width=8)
+        self.bw_mode_box.grid(row=1, column=2, sticky=tk.W, padx=5, pady=2)
+        self.bw.trace_add("write", lambda *args: self.bw_mode_box.config(state="readonly" if self.bw.get() else "disabled"))
+        
+        ttk.Checkbutton(options_frame, text="Add noise", variable=self.add_noise).grid(row=2, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Checkbutton(options_frame, text="Add shadow", variable=self.add_shadow).grid(row=2, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        ttk.Checkbutton(options_frame, text="Add fold marks", variable=self.fold_marks).grid(row=3, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(options_frame, text="Folds:").grid(row=3, column=1, sticky=tk.W, padx=5, pady=2)
+        ttk.Spinbox(options_frame, from_=1, to=5, textvariable=self.fold_count, width=5).grid(row=3, column=2, sticky=tk.W, padx=5, pady=2)
+        
+        ttk.Label(options_frame, text="DPI:").grid(row=4, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Scale(options_frame, from_=72, to=300, variable=self.dpi, orient=tk.HORIZONTAL, length=150).grid(row=4, column=1, columnspan=2, padx=5, pady=2)
+        
+        ttk.Label(options_frame, text="Quality:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Scale(options_frame, from_=50, to=100, variable=self.quality, orient=tk.HORIZONTAL, length=150).grid(row=5, column=1, columnspan=2, padx=5, pady=2)
+        
+        ttk.Label(options_frame, text="Blur:").grid(row=6, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Scale(options_frame, from_=0, to=2.0, variable=self.blur, orient=tk.HORIZONTAL, length=150).grid(row=6, column=1, columnspan=2, padx=5, pady=2)
+        
+        # Scanner name frame
+        scanner_frame = ttk.Frame(options_frame)
+        scanner_frame.grid(row=7, column=0, columnspan=3, sticky="ew", padx=5, pady=5)
+        
+        ttk.Label(scanner_frame, text="Scanner:").pack(side=tk.LEFT)
+        ttk.Entry(scanner_frame, textvariable=self.scanner_name, width=25).pack(side=tk.LEFT, padx=5)
+        ttk.Button(scanner_frame, text="Random", command=self.randomize_scanner).pack(side=tk.LEFT, padx=5)
+        
+        # Progress bar
+        self.progress = ttk.Progressbar(left_frame, orient=tk.HORIZONTAL, mode='determinate')
+        self.progress.pack(fill="x", padx=5, pady=5)
+        
+        # Status label
+        self.status_var = tk.StringVar(value="Ready")
+        self.status_label = ttk.Label(left_frame, textvariable=self.status_var)
+        self.status_label.pack(padx=5, pady=2)
+        
+        # Action buttons
+        button_frame = ttk.Frame(left_frame)
+        button_frame.pack(fill="x", padx=5, pady=5)
+        
+        self.create_button = ttk.Button(button_frame, text="Create Scanned PDF", command=self.process_pdf_threaded)
+        self.create_button.pack(side=tk.RIGHT, padx=2)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_processing, state="disabled")
+        self.cancel_button.pack(side=tk.RIGHT, padx=2)
+        ttk.Button(button_frame, text="Exit", command=self.root.quit).pack(side=tk.RIGHT, padx=2)
+        
+        # Preview section
+        self.setup_preview(right_frame)
+    
+    def setup_preview(self, parent):
+        """Setup the PDF preview section"""
+        # Preview controls
+        control_frame = ttk.Frame(parent)
+        control_frame.pack(fill="x", padx=5, pady=5)
+        
+        self.prev_button = ttk.Button(control_frame, text="◀ Previous", command=self.prev_page, state="disabled")
+        self.prev_button.pack(side=tk.LEFT, padx=2)
+        
+        self.page_label = ttk.Label(control_frame, text="No PDF loaded")
+        self.page_label.pack(side=tk.LEFT, expand=True)
+        
+        self.preview_effects_button = ttk.Button(control_frame, text="Preview Effects", command=self.preview_effects, state="disabled")
+        self.preview_effects_button.pack(side=tk.RIGHT, padx=2)
+        ttk.Checkbutton(control_frame, text="Live", variable=self.live_preview).pack(side=tk.RIGHT, padx=2)
+        zoom_box = ttk.Combobox(control_frame, textvariable=self.zoom, values=ZOOM_LEVELS, state="readonly", width=8)
+        zoom_box.pack(side=tk.RIGHT, padx=2)
+        zoom_box.bind("<<ComboboxSelected>>", lambda event: self.update_preview(force_original=True))
+        
+        self.next_button = ttk.Button(control_frame, text="Next ▶", command=self.next_page, state="disabled")
+        self.next_button.pack(side=tk.RIGHT, padx=2)
+        
+        # Preview canvas
+        self.preview_canvas = tk.Canvas(parent, bg="white", width=300, height=400)
+        self.preview_canvas.pack(fill="both", expand=True, padx=5, pady=5)
+        
+        # Scrollbars for canvas
+        v_scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self.preview_canvas.yview)
+        v_scrollbar.pack(side="right", fill="y")
+        h_scrollbar = ttk.Scrollbar(parent, orient="horizontal", command=self.preview_canvas.xview)
+        h_scrollbar.pack(side="bottom", fill="x")
+        
+        # Zoomed previews fetch the tiles that scroll into view
+        def on_scroll(scrollbar):
+            def update(*args):
+                scrollbar.set(*args)
+                self.schedule_tiles()
+            return update
+        self.preview_canvas.configure(yscrollcommand=on_scroll(v_scrollbar), xscrollcommand=on_scroll(h_scrollbar))
+        self.preview_canvas.bind("<Configure>", lambda event: self.schedule_tiles())
+        self.preview_canvas.bind("<MouseWheel>", lambda event: self.preview_canvas.yview_scroll(-event.delta // 120, "units"))
+        self.preview_canvas.bind("<Button-4>", lambda event: self.preview_canvas.yview_scroll(-3, "units"))
+        self.preview_canvas.bind("<Button-5>", lambda event: self.preview_canvas.yview_scroll(3, "units"))
+    
+    def randomize_scanner(self):
+        """Randomize the scanner name from the predefined list"""
+        random_scanner = random.choice(PDFScannerEffects.PRINTER_NAMES)
+        self.scanner_name.set(random_scanner)
+    
+    def load_pdf_preview(self, pdf_path):
+        """Load PDF for preview"""
+        try:
+            if self.renderer:
+                self.renderer.close()
+            
+            self.renderer_generation += 1
+            generation = self.renderer_generation
+            self.renderer = PreviewRenderer(pdf_path, lambda event: self.preview_events.put(("render", generation, event)))
+            self.total_pages = self.renderer.page_count
+            self.current_page = 0
+            self.original_image = None
+            
+            if self.total_pages > 0:
+                self.update_preview()
+                self.prev_button.config(state="normal" if self.total_pages > 1 else "disabled")
+                self.next_button.config(state="normal" if self.total_pages > 1 else "disabled")
+                self.preview_effects_button.config(state="normal")
+            else:
+                self.page_label.config(text="Empty PDF")
+                
+        except Exception as e:
+            messagebox.showerror("Preview Error", f"Could not load PDF preview: {str(e)}")
+            self.page_label.config(text="Preview not available")
+    
+    def update_preview(self, force_original=False):
+        """Update the preview with current page, once it has been rendered"""
+        if not self.renderer or self.current_page >= self.total_pages:
+            return
+        
+        if self.zoom_dpi():
+            if force_original:
+                self.zoom_effects = False
+                self.tile_view = None
+                self.preview_canvas.xview_moveto(0)
+                self.preview_canvas.yview_moveto(0)
+            self.refresh_tiles()
+            return
+        self.tile_view = None
+        self.tile_images = {}
+        
+        img = self.renderer.request(self.current_page)
+        if img is None:
+            self.original_image = None
+            self.page_label.config(text=f"Page {self.current_page + 1} of {self.total_pages} (rendering...)")
+            return
+        self.show_page_image(img, force_original)
+    
+    def poll_preview_events(self):
+        """Show pages and effect previews from background threads if still wanted"""
+        try:
+            while True:
+                event = self.preview_events.get_nowait()
+                if event[0] == "render":
+                    _, generation, event = event
+                    if generation != self.renderer_generation:
+                        continue
+                if event[0] == "tile":
+                    _, page_num, dpi, signature, box, img = event
+                    if (page_num, dpi, signature) != self.tile_view:
+                        continue
+                    if isinstance(img, Exception):
+                        self.page_label.config(text=f"Preview error: {str(img)}")
+                    else:
+                        self.draw_tile(box, img)
+                elif event[0] == "page":
+                    _, page_num, scale, img = event
+                    if (page_num != self.current_page or scale != PREVIEW_SCALE or self.effects_applied
+                            or self.tile_view is not None):
+                        continue
+                    if isinstance(img, Exception):
+                        self.page_label.config(text=f"Preview error: {str(img)}")
+                    else:
+                        self.show_page_image(img, force_original=True)
+                elif event[0] == "effects":
+                    _, generation, page_num, img = event
+                    if generation != self.effect_generation or page_num != self.current_page:
+                        continue
+                    if isinstance(img, Exception):
+                        self.page_label.config(text=f"Could not apply effects: {str(img)}")
+                    else:
+                        self.effects_applied = True
+                        self.display_image(img)
+        except queue.Empty:
+            pass
+        self.root.after(50, self.poll_preview_events)
+    
+    def show_page_image(self, img, force_original=False):
+        # Store original for effects preview
+        if force_original or self.original_image is None or not self.effects_applied:
+            self.original_image = img.copy()
+            self.effects_applied = False
+        self.display_image(img)
+        if force_original:
+            self.schedule_effect_preview()
+    
+    def display_image(self, img):
+        try:
+            # Convert to PhotoImage for tkinter
+            self.preview_image = ImageTk.PhotoImage(img)
+            
+            # Clear canvas and add image
+            self.preview_canvas.delete("all")
+            self.preview_canvas.create_image(0, 0, anchor="nw", image=self.preview_image)
+            
+            # Update scroll region
+            self.preview_canvas.configure(scrollregion=self.preview_canvas.bbox("all"))
+            
+            # Update page label
+            effects_text = " (with effects)" if self.effects_applied else ""
+            self.page_label.config(text=f"Page {self.current_page + 1} of {self.total_pages}{effects_text}")
+            
+        except Exception as e:
+            self.page_label.config(text=f"Preview error: {str(e)}")
+    
+    def zoom_dpi(self):
+        """DPI of the zoomed preview, or None when the whole page is fitted"""
+        zoom = self.zoom.get()
+        return None if zoom == ZOOM_LEVELS[0] else int(zoom.split()[0])
+    
+    def tile_options(self):
+        """Effect options for zoomed tiles, or None to show the plain page"""
+        if not (self.live_preview.get() or self.zoom_effects):
+            return None
+        try:
+            return {
+                'rotate': self.rotate.get(),
+                'max_rotation': self.max_rotation.get(),
+                'grayscale': self.grayscale.get(),
+                'bw': self.bw.get(),
+                'bw_mode': self.bw_mode.get() if self.bw.get() else "global",
+                'add_noise': self.add_noise.get(),
+                'fold_marks': self.fold_marks.get(),
+                'fold_count': self.fold_count.get(),
+                'add_shadow': self.add_shadow.get(),
+                'blur': self.blur.get()
+            }
+        except tk.TclError:
+            return None
+    
+    def schedule_tiles(self):
+        """Coalesce scroll and resize events into one tile refresh"""
+        if self.tile_view is not None and self.tile_refresh is None:
+            self.tile_refresh = self.root.after(30, self.refresh_tiles)
+    
+    def refresh_tiles(self):
+        """Show the cached tiles around the viewport of a zoomed page and request the rest"""
+        self.tile_refresh = None
+        dpi = self.zoom_dpi()
+        if not self.renderer or not dpi:
+            return
+        options = self.tile_options()
+        view = (self.current_page, dpi, PreviewRenderer.signature(options))
+        width, height = self.renderer.pixel_size(self.current_page, dpi)
+        if view != self.tile_view:
+            self.tile_view = view
+            self.tile_images = {}
+            self.preview_canvas.delete("all")
+            self.preview_canvas.configure(scrollregion=(0, 0, width, height))
+            effects_text = " with effects" if options else ""
+            self.page_label.config(text=f"Page {self.current_page + 1} of {self.total_pages} at {dpi} DPI{effects_text}")
+        
+        # Visible tiles first, then a ring of one tile around them
+        canvas = self.preview_canvas
+        x0, y0 = int(canvas.canvasx(0)), int(canvas.canvasy(0))
+        x1, y1 = x0 + canvas.winfo_width(), y0 + canvas.winfo_height()
+        boxes = []
+        for ring in (0, TILE_SIZE):
+            for top in range(max(0, y0 - ring) // TILE_SIZE * TILE_SIZE, min(height, y1 + ring), TILE_SIZE):
+                for left in range(max(0, x0 - ring) // TILE_SIZE * TILE_SIZE, min(width, x1 + ring), TILE_SIZE):
+                    box = (left, top, min(left + TILE_SIZE, width), min(top + TILE_SIZE, height))
+                    if box not in boxes:
+                        boxes.append(box)
+        
+        # Tk keeps a full copy of every drawn tile, so drop the ones far out of view
+        for box in [box for box in self.tile_images if box not in boxes]:
+            canvas.delete(f"tile_{box[0]}_{box[1]}")
+            del self.tile_images[box]
+        
+        missing = [box for box in boxes if box not in self.tile_images]
+        for box, img in self.renderer.request_tiles(self.current_page, dpi, missing, options).items():
+            self.draw_tile(box, img)
+    
+    def draw_tile(self, box, img):
+        if box in self.tile_images:
+            return
+        self.tile_images[box] = ImageTk.PhotoImage(img)
+        self.preview_canvas.create_image(box[0], box[1], anchor="nw", image=self.tile_images[box],
+                                         tags=f"tile_{box[0]}_{box[1]}")
+    
+    def schedule_effect_preview(self, *args):
+        """Debounce setting changes into a single live effect preview run"""
+        if self.effect_timer is not None:
+            self.root.after_cancel(self.effect_timer)
+            self.effect_timer = None
+        if self.live_preview.get() and (self.original_image or self.tile_view is not None):
+            self.effect_timer = self.root.after(300, self.preview_effects)
+    
+    def preview_effects(self):
+        """Apply scanning effects to the current preview page on a worker thread"""
+        self.effect_timer = None
+        if self.effect_cancel is not None:
+            self.effect_cancel.cancel()
+        if self.zoom_dpi():
+            # Zoomed tiles carry their own effects; a change of options re-requests them
+            self.zoom_effects = True
+            self.refresh_tiles()
+            return
+        if not self.original_image:
+            return
+        
+        try:
+            # Get current options; the preview image is at PREVIEW_SCALE of 72 DPI
+            options = {
+                'dpi': round(72 * PREVIEW_SCALE),
+                'rotate': self.rotate.get(),
+                'max_rotation': self.max_rotation.get(),
+                'grayscale': self.grayscale.get(),
+                'bw': self.bw.get(),
+                'bw_mode': self.bw_mode.get() if self.bw.get() else "global",
+                'add_noise': self.add_noise.get(),
+                'fold_marks': self.fold_marks.get(),
+                'fold_count': self.fold_count.get(),
+                'add_shadow': self.add_shadow.get(),
+                'blur': self.blur.get()
+            }
+        except tk.TclError:
+            # A half-typed value in an entry; wait for the next change
+            return
+        
+        self.effect_generation += 1
+        self.effect_cancel = CancelToken()
+        threading.Thread(target=self.run_effect_preview, daemon=True,
+                         args=(self.effect_generation, self.current_page, self.original_image.copy(),
+                               options, self.effect_cancel)).start()
+    
+    def run_effect_preview(self, generation, page_num, img, options, cancel_token):
+        """Worker thread: run the effect chain and queue the result unless superseded"""
+        try:
+            # Same random draws for a page on every run, so only the settings change the preview
+            img = ScanPipeline(options, cancel_token).apply(img, np.random.default_rng(page_num))
+        except ProcessingCancelled:
+            return
+        except Exception as e:
+            img = e
+        self.preview_events.put(("effects", generation, page_num, img))
+    
+    def prev_page(self):
+        """Go to previous page"""
+        if self.current_page > 0:
+            self.current_page -= 1
+            self.effects_applied = False
+            self.update_preview(force_original=True)
+    
+    def next_page(self):
+        """Go to next page"""
+        if self.current_page < self.total_pages - 1:
+            self.current_page += 1
+            self.effects_applied = False
+            self.update_preview(force_original=True)
+    
+    def browse_input(self):
+        filename = filedialog.askopenfilename(
+            title="Select input PDF file",
+            filetypes=(("PDF files", "*.pdf"), ("All files", "*.*"))
+        )
+        if filename:
+            self.input_pdf.set(filename)
+            # Suggest output filename
+            base, ext = os.path.splitext(filename)
+            self.output_pdf.set(f"{base}_scanned{ext}")
+            # Load preview
+            self.load_pdf_preview(filename)
+    
+    def browse_output(self):
+        filename = filedialog.asksaveasfilename(
+            title="Save scanned PDF as",
+            defaultextension=".pdf",
+            filetypes=(("PDF files", "*.pdf"), ("All files", "*.*"))
+        )
+        if filename:
+            self.output_pdf.set(filename)
+    
+    def process_pdf_threaded(self):
+        if not self.input_pdf.get():
+            messagebox.showerror("Error", "Please select an input PDF file")
+            return
+        
+        if not self.output_pdf.get():
+            messagebox.showerror("Error", "Please specify an output PDF file")
+            return
+        
+        options = {
+            'dpi': self.dpi.get(),
+            'rotate': self.rotate.get(),
+            'max_rotation': self.max_rotation.get(),
+            'grayscale': self.grayscale.get(),
+            'bw': self.bw.get(),
+            'bw_mode': self.bw_mode.get() if self.bw.get() else "global",
+            'add_noise': self.add_noise.get(),
+            'fold_marks': self.fold_marks.get(),
+            'fold_count': self.fold_count.get(),
+            'quality': self.quality.get(),
+            'scanner_name': self.scanner_name.get(),
+            'add_shadow': self.add_shadow.get(),
+            'blur': self.blur.get()
+        }
+        
+        self.cancel_token = CancelToken()
+        self.job_output = self.output_pdf.get()
+        self.create_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.status_var.set("Processing...")
+        self.progress['value'] = 0
+        
+        threading.Thread(target=self.process_pdf, daemon=True,
+                         args=(self.input_pdf.get(), self.job_output, options, self.cancel_token)).start()
+        self.root.after(100, self.poll_events)
+    
+    def cancel_processing(self):
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.cancel_button.config(state="disabled")
+            self.status_var.set("Cancelling...")
+    
+    def process_pdf(self, input_pdf, output_pdf, options, cancel_token):
+        """Worker thread: process the PDF and queue progress and the outcome"""
+        def progress(done, total, eta):
+            self.events.put(("progress", done, total, eta))
+        
+        try:
+            pages = PDFScannerEffects.process_pdf(input_pdf, output_pdf, options, progress, cancel_token)
+            self.events.put(("done", pages))
+        except ProcessingCancelled as e:
+            self.events.put(("cancelled", e.pages_done))
+        except Exception as e:
+            self.events.put(("error", str(e)))
+    
+    def poll_events(self):
+        """Apply queued events from the worker thread to the widgets"""
+        finished = False
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == "progress":
+                done, total, eta = event[1:]
+                self.progress['value'] = 100 * done / total if total else 0
+                if eta is None or not self.cancel_button.instate(["!disabled"]):
+                    continue
+                self.status_var.set(f"Processing page {min(done + 1, total)} of {total}, about {eta:.0f} s left")
+            elif kind == "done":
+                finished = True
+                self.status_var.set("Completed!")
+                self.progress['value'] = 100
+                messagebox.showinfo("Success", f"Created scanned-looking PDF: {self.job_output}")
+            elif kind == "cancelled":
+                finished = True
+                pages = event[1]
+                if pages:
+                    self.status_var.set(f"Cancelled, the first {pages} pages were saved")
+                    messagebox.showinfo("Cancelled", f"Saved the first {pages} pages to: {self.job_output}")
+                else:
+                    self.status_var.set("Cancelled")
+            elif kind == "error":
+                finished = True
+                self.status_var.set(f"Error: {event[1]}")
+                messagebox.showerror("Error", f"An error occurred: {event[1]}")
+        
+        if finished:
+            self.cancel_token = None
+            self.create_button.config(state="normal")
+            self.cancel_button.config(state="disabled")
+        else:
+            self.root.after(100, self.poll_events)
+
+def run_gui():
+    root = tk.Tk()
+    app = ScannerApp(root)
+    root.mainloop()
+
+if __name__ == "__main__":
+    run_gui()
@@ -0,0 +1,213 @@
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingUnixStreamServer
+from urllib.parse import parse_qsl, urlsplit
+from main import PDFScannerEffects, WarmPagePool, parse_seed, parse_size, parse_tile_size
+
+# Per-request options accepted in the query string, with their types
+OPTION_TYPES = {
+    'dpi': int, 'rotate': bool, 'max_rotation': float, 'render_rotation': bool, 'grayscale': bool,
+    'bw': bool, 'bw_mode': str, 'add_noise': bool, 'fold_marks': bool, 'fold_count': int,
+    'quality': int, 'scanner_name': str, 'add_shadow': bool, 'blur': float, 'seed': parse_seed, 'tile_size': parse_tile_size,
+    'target_size': parse_size, 'target_per': str,
+}
+# Allowed values of the options that take one of a few
+CHOICES = {'bw_mode': ("global", "sauvola", "niblack"), 'target_per': ("document", "page")}
+
+class ServiceBusy(Exception):
+    """Raised when the request queue of a ScanService is full"""
+
+class ScanService:
+    """Runs process_pdf for many callers on one warm worker pool
+    
+    At most max_active requests are processed at once; up to max_queued
+    more wait for a slot in arrival order, and anything beyond that is
+    turned away with ServiceBusy so callers can back off instead of piling
+    up. Every request is written in streaming mode, so its pages go out
+    as they finish.
+    """
+    
+    def __init__(self, options, workers=None, max_active=None, max_queued=16):
+        self.options = dict(options, stream=True)
+        self.pool = WarmPagePool(workers)
+        self.max_active = max_active or self.pool.workers
+        self.max_queued = max_queued
+        self.slots = threading.Semaphore(self.max_active)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.active = 0
+        self.served = 0
+    
+    @staticmethod
+    def parse_options(query):
+        """Options dict from a query string such as 'dpi=300&bw=1&bw_mode=sauvola'"""
+        options = {}
+        for name, value in parse_qsl(query, keep_blank_values=True):
+            if name not in OPTION_TYPES:
+                raise ValueError(f"Unknown option: {name}")
+            kind = OPTION_TYPES[name]
+            if kind is bool:
+                if value.lower() not in ("", "1", "0", "true", "false", "yes", "no"):
+                    raise ValueError(f"Option {name} must be a boolean, not {value!r}")
+                options[name] = value.lower() in ("", "1", "true", "yes")
+            else:
+                try:
+                    options[name] = kind(value)
+                except ValueError:
+                    raise ValueError(f"Invalid value for option {name}: {value!r}") from None
+            if name in CHOICES and options[name] not in CHOICES[name]:
+                raise ValueError(f"Option {name} must be one of {', '.join(CHOICES[name])}")
+        return options
+    
+    def status(self):
+        with self.lock:
+            return {"workers": self.pool.workers, "active": self.active, "queued": self.waiting,
+                    "max_active": self.max_active, "max_queued": self.max_queued, "served": self.served}
+    
+    def process(self, data, options, output):
+        """Process PDF bytes with the service options overridden by options into output
+        
+        Waits for a free slot first, or raises ServiceBusy if too many
+        requests are waiting already. Returns the number of pages written.
+        """
+        with self.lock:
+            if self.active + self.waiting >= self.max_active + self.max_queued:
+                raise ServiceBusy()
+            self.waiting += 1
+        self.slots.acquire()
+        with self.lock:
+            self.waiting -= 1
+            self.active += 1
+        try:
+            pages = PDFScannerEffects.process_pdf(data, output, dict(self.options, **options, pool=self.pool))
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.served += 1
+            self.slots.release()
+        return pages
+    
+    def close(self):
+        self.pool.close()
+
+class ChunkedResponse:
+    """File-like writer sending a 200 PDF response with chunked transfer encoding
+    
+    Writes are collected and sent as one chunk on every flush, which the
+    PDF writer does after each page. The status line and headers go out
+    with the first chunk, so a request that fails before any output can
+    still get an error status.
+    """
+    
+    def __init__(self, handler):
+        self.handler = handler
+        self.buffer = bytearray()
+        self.started = False
+    
+    def write(self, data):
+        self.buffer += data
+    
+    def flush(self):
+        if not self.buffer:
+            return
+        if not self.started:
+            self.handler.send_response(200)
+            self.handler.send_header("Content-Type", "application/pdf")
+            self.handler.send_header("Transfer-Encoding", "chunked")
+            self.handler.end_headers()
+            self.started = True
+        self.handler.wfile.write(b"%x\r\n%s\r\n" % (len(self.buffer), self.buffer))
+        self.buffer.clear()
+    
+    def finish(self):
+        self.flush()
+        self.handler.wfile.write(b"0\r\n\r\n")
+
+class ScanRequestHandler(BaseHTTPRequestHandler):
+    """POST /scan?<options> with the PDF as the body returns the scanned PDF; GET /status reports the load"""
+    protocol_version = "HTTP/1.1"
+    
+    def send_json(self, code, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def do_GET(self):
+        if urlsplit(self.path).path != "/status":
+            return self.send_json(404, {"error": "not found"})
+        self.send_json(200, self.server.service.status())
+    
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/scan":
+            return self.send_json(404, {"error": "not found"})
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self.send_json(411, {"error": "Content-Length is required"})
+        data = self.rfile.read(int(length))
+        try:
+            options = ScanService.parse_options(url.query)
+        except ValueError as error:
+            return self.send_json(400, {"error": str(error)})
+        
+        response = ChunkedResponse(self)
+        try:
+            self.server.service.process(data, options, response)
+        except ServiceBusy:
+            return self.send_json(503, {"error": "too many requests queued"}, [("Retry-After", "1")])
+        except Exception as error:
+            if response.started:
+                # Part of the PDF is out already: dropping the connection marks it incomplete
+                self.close_connection = True
+                self.log_error("request failed after output started: %s", error)
+                return
+            return self.send_json(422, {"error": str(error)})
+        response.finish()
+
+class UnixHTTPServer(ThreadingUnixStreamServer):
+    daemon_threads = True
+    
+    def get_request(self):
+        # Unix socket peers have no address, which request logging expects
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+def create_server(address, service):
+    """HTTP server on 'host:port' or 'unix:/path/to/socket' answering with service"""
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if os.path.exists(path):
+            os.remove(path)
+        server = UnixHTTPServer(path, ScanRequestHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), ScanRequestHandler)
+    server.service = service
+    return server
+
+def run_service(address, options, max_queued=16):
+    """Serve scan requests on address until interrupted"""
+    service = ScanService(options, options.get('workers') or None, max_queued=max_queued)
+    server = create_server(address, service)
+    print(f"Scanning service on {address} with {service.pool.workers} warm workers", file=sys.stderr)
+    # Stop as cleanly on SIGTERM from a service manager as on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if server.address_family == socket.AF_UNIX:
+            os.remove(server.server_address)